@@ -0,0 +1,66 @@
+"""
+XiangHookMsg消息渲染基准测试：对比改动前的 % 格式化 + 正则替换 + str.replace 与预编译模板的 MessageRenderer
+以站点每日数据统计通知这类长文本为样本
+
+用法（在MoviePilot项目根目录下运行）：
+PYTHONPATH=. python <插件仓库>/benchmarks/xianghookmsg_render.py [-n 渲染次数] [--sites 站点数]
+"""
+import argparse
+import importlib.util
+import re
+import timeit
+from pathlib import Path
+
+spec = importlib.util.spec_from_file_location(
+    "xianghookmsg_renderer", Path(__file__).parent.parent / "plugins.v2" / "xianghookmsg" / "renderer.py")
+renderer_module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(renderer_module)
+MessageRenderer = renderer_module.MessageRenderer
+
+new_line_after_2space_pattern = re.compile(' *\n')
+
+
+def old_render(title: str, text: str, link: str = None, breaks: bool = False) -> str:
+    """
+    改动前的渲染方式
+    """
+    rc_text = None
+    if title:
+        if link:
+            rc_text = "[%s](%s)  \n" % (title, link)
+        else:
+            rc_text = "# %s  \n" % title
+    if text:
+        rc_text = "%s%s \n" % (rc_text, text)
+    if breaks:
+        trim_text = new_line_after_2space_pattern.sub('\n', rc_text)
+        rc_text = str.replace(trim_text, '\n', '  \n')
+    return rc_text
+
+
+def sample_text(sites: int) -> str:
+    lines = [f"【站点{i:03d}】 \n上传量：{i * 1.37:.2f} GB \n下载量：{i * 0.41:.2f} GB \n" for i in range(sites)]
+    return "".join(lines) + "————————————\n总上传：1.21 TB\n总下载：356.40 GB"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=2000, help="每种方式的渲染次数")
+    parser.add_argument("--sites", type=int, default=200, help="样本中的站点数")
+    args = parser.parse_args()
+
+    title = "站点每日数据统计"
+    text = sample_text(args.sites)
+    print(f"样本长度 {len(text)} 字符，每种方式渲染 {args.n} 次")
+    for breaks in (False, True):
+        renderer = MessageRenderer(breaks=breaks)
+        # 改动前后输出一致
+        assert renderer.render(title, text) == old_render(title, text, breaks=breaks)
+        old = min(timeit.repeat(lambda: old_render(title, text, breaks=breaks), number=args.n, repeat=5))
+        new = min(timeit.repeat(lambda: renderer.render(title, text), number=args.n, repeat=5))
+        print(f"硬换行{'开启' if breaks else '关闭'}  改动前 {old / args.n * 1e6:8.2f} us/次  "
+              f"改动后 {new / args.n * 1e6:8.2f} us/次  {old / new:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
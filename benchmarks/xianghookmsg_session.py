@@ -0,0 +1,89 @@
+"""
+XiangHookMsg webhook发送延迟基准测试：与插件相同经 RequestUtils 发送，
+对比每次发送新建连接（改动前）与复用保持连接的会话（改动后）的 p50/p99 延迟，本地启动一个桩服务器模拟webhook服务端
+
+用法（在MoviePilot项目根目录下运行）：
+PYTHONPATH=. python <插件仓库>/benchmarks/xianghookmsg_session.py [-n 请求数] [--delay 服务端处理耗时（毫秒）]
+"""
+import argparse
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.utils.http import RequestUtils
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # 支持连接保持
+    protocol_version = "HTTP/1.1"
+    # 响应头和响应体分开写入，关闭Nagle算法避免连接保持时的延迟确认等待
+    disable_nagle_algorithm = True
+    delay = 0.0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.delay:
+            time.sleep(self.delay)
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def percentile(latencies: List[float], p: float) -> float:
+    latencies = sorted(latencies)
+    return latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000
+
+
+def run(name: str, post: Callable[[], Optional[requests.Response]], count: int):
+    # 预热
+    post()
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        res = post()
+        latencies.append(time.perf_counter() - start)
+        assert res is not None and res.status_code == 200
+    print(f"{name:<12} p50 {percentile(latencies, 0.5):7.3f} ms  p99 {percentile(latencies, 0.99):7.3f} ms  "
+          f"总耗时 {sum(latencies):.2f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=1000, help="每种方式的请求数")
+    parser.add_argument("--delay", type=float, default=0, help="桩服务器处理耗时（毫秒）")
+    args = parser.parse_args()
+
+    StubHandler.delay = args.delay / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/hooks/bench"
+    payload = {"text": "# 站点每日数据统计  \n" + "站点 上传 1.2 GB 下载 300 MB \n" * 20, "image": ""}
+
+    # 改动前：每次发送新建连接
+    run("新建连接", lambda: RequestUtils(timeout=10, content_type="application/json").post_res(url, json=payload),
+        args.n)
+
+    # 改动后：复用保持连接的会话，与插件的会话配置一致
+    with requests.Session() as session:
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        run("复用会话", lambda: RequestUtils(session=session, timeout=10,
+                                             content_type="application/json").post_res(url, json=payload), args.n)
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,4 @@
-import threading
-import re
-
-import apprise
-
-from queue import Queue
-from time import time, sleep
-from typing import Any, List, Dict, Tuple
+from typing import Any, List, Dict, Tuple, Optional
 from urllib.parse import urlencode
 
 from app.core.event import eventmanager, Event
@@ -14,6 +7,9 @@ from app.plugins import _PluginBase
 from app.schemas.types import EventType, NotificationType
 from app.utils.http import RequestUtils
 
+from .lanes import NotifyDispatcher, NotifyLane
+from .renderer import MessageRenderer
+
 
 class AppriseExtMsg(_PluginBase):
     # 插件名称
@@ -23,7 +19,7 @@ class AppriseExtMsg(_PluginBase):
     # 插件图标
     plugin_icon = "https://raw.githubusercontent.com/homarr-labs/dashboard-icons/refs/heads/main/png/apprise.png"
     # 插件版本
-    plugin_version = "1.2"
+    plugin_version = "1.8"
     # 插件作者
     plugin_author = "Xiang"
     # 作者主页
@@ -42,48 +38,55 @@ class AppriseExtMsg(_PluginBase):
     # convert '\n' to "  \n"(add two spaces)
     _breaks = False 
 
-    # 消息处理线程
-    processing_thread = None
-    # 上次发送时间
-    last_send_time = 0
-    # 消息队列
-    message_queue = Queue()
-    # 消息发送间隔（秒）
-    send_interval = 5
-    # 退出事件
-    __event = threading.Event()
-    # apprise实例
-    apobj = None
-    # 换行符替换正则
-    new_line_after_2space_pattern = re.compile(' *\n')
+    # 默认消息发送间隔（秒）
+    _send_interval = 5
+    # 默认单条消息发送超时时间（秒）
+    _notify_timeout = 30
+    # 异步发送调度，每个通知渠道URL一个发送通道
+    _dispatcher: Optional[NotifyDispatcher] = None
+    # 消息模板
+    _title_template = None
+    _link_template = None
+    _text_template = None
+    _renderer: Optional[MessageRenderer] = None
 
     def init_plugin(self, config: dict = None):
-        self.__event.clear()
+        self.stop_service()
         if config:
             self._enabled = config.get("enabled")
             self._url = config.get("url")
             self._msgtypes = config.get("msgtypes") or []
             self._breaks = config.get("breaks") or False
+            self._title_template = config.get("title_template")
+            self._link_template = config.get("link_template")
+            self._text_template = config.get("text_template")
+            self._send_interval = float(config.get("send_interval") or 5)
+            self._notify_timeout = float(config.get("notify_timeout") or 30)
+        # 预编译消息模板
+        self._renderer = MessageRenderer(
+            title=MessageRenderer.try_compile(self._title_template, "{title}"),
+            link_title=MessageRenderer.try_compile(self._link_template, "[{title}]({link})") + "  \n",
+            text=MessageRenderer.try_compile(self._text_template, "{text}"),
+            breaks=self._breaks)
 
-            if self._enabled and self._url:
-                # 初始化 apprise客户端实例
-                self.apobj = apprise.Apprise()
-                # 配置生效
-                server_urls = self._url.split("\n")
-                for server_url in server_urls:
-                    if not server_url:
-                        continue
-                    try:
-                        self.apobj.add(server_url)
-                    except Exception as err:
-                        logger.error(f"Apprise 通知渠道配置{err}")
-                        self.systemmessage.put(f"Apprise 通知渠道配置{err}", title="Apprise 通知")
-                        continue
-                                    
-                # 启动处理队列的后台线程
-                self.processing_thread = threading.Thread(target=self.process_queue)
-                self.processing_thread.daemon = True
-                self.processing_thread.start()
+        if self._enabled and self._url:
+            # 每个通知渠道一个发送通道，行内可在URL后以空格分隔指定发送间隔和超时时间
+            lanes = []
+            for line in self._url.split("\n"):
+                parts = line.strip().split()
+                if not parts:
+                    continue
+                try:
+                    interval = float(parts[1]) if len(parts) > 1 else self._send_interval
+                    timeout = float(parts[2]) if len(parts) > 2 else self._notify_timeout
+                    lanes.append(NotifyLane(url=parts[0], interval=interval, timeout=timeout))
+                except Exception as err:
+                    logger.error(f"Apprise 通知渠道配置{err}")
+                    self.systemmessage.put(f"Apprise 通知渠道配置{err}", title="Apprise 通知")
+                    continue
+            if lanes:
+                self._dispatcher = NotifyDispatcher(lanes)
+                self._dispatcher.start()
 
     def get_state(self) -> bool:
         return self._enabled and (True if self._url else False)
@@ -162,13 +165,53 @@ class AppriseExtMsg(_PluginBase):
                                             'model': 'url',
                                             'label': '通知渠道URL',
                                             'rows': 10,
-                                            'placeholder': '一行一个通知渠道URL, 例如 gotify://hostname/token',
+                                            'placeholder': '一行一个通知渠道URL, 例如 gotify://hostname/token，'
+                                                           '可在URL后以空格分隔指定该渠道的发送间隔及超时时间（秒）',
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'send_interval',
+                                            'label': '默认发送间隔（秒）',
+                                            'placeholder': '5',
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'notify_timeout',
+                                            'label': '默认发送超时时间（秒）',
+                                            'placeholder': '30',
                                         }
                                     }
                                 ]
                             }
                         ]
-                    },            
+                    },
                     {
                         'component': 'VRow',
                         'content': [
@@ -236,13 +279,74 @@ class AppriseExtMsg(_PluginBase):
                             }
                         ]
                     },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'title_template',
+                                            'label': '标题模板',
+                                            'placeholder': '{title}',
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'link_template',
+                                            'label': '带链接的标题模板',
+                                            'placeholder': '[{title}]({link})',
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'text_template',
+                                            'label': '正文模板',
+                                            'placeholder': '{text}',
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
                 ]
             }
         ], {
             "enabled": False,
             'breaks': False,
             'url': '',
-            'msgtypes': []
+            'msgtypes': [],
+            'send_interval': 5,
+            'notify_timeout': 30,
+            'title_template': '',
+            'link_template': '',
+            'text_template': ''
         }
 
     def get_page(self) -> List[dict]:
@@ -262,68 +366,32 @@ class AppriseExtMsg(_PluginBase):
             logger.warn("标题和内容不能同时为空")
             return
 
-        # 将消息加入队列
-        self.message_queue.put(msg_body)
-        logger.info("消息已加入队列等待发送")
-
-    def process_queue(self):
-        """
-        处理队列中的消息，按间隔时间发送
-        """
-        while True:
-            if self.__event.is_set():
-                logger.info("消息发送线程正在退出...")
-                break
-            # 获取队列中的下一条消息
-            msg_body = self.message_queue.get()
-
-            # 检查是否满足发送间隔时间
-            current_time = time()
-            time_since_last_send = current_time - self.last_send_time
-            if time_since_last_send < self.send_interval:
-                sleep(self.send_interval - time_since_last_send)
-
-            # 处理消息内容
-            channel = msg_body.get("channel")
-            if channel:
-                continue
-            msg_type: NotificationType = msg_body.get("type")
-            title = msg_body.get("title")
-            text = msg_body.get("text")
-
-            # 检查消息类型是否已启用
-            if msg_type and self._msgtypes and msg_type.name not in self._msgtypes:
-                logger.info(f"消息类型 {msg_type.value} 未开启消息发送")
-                continue
-
-            # 尝试发送消息
-            try:
-                rc_text = None
-                rc_title = None
-                if title:
-                    if msg_body.get("link"):
-                        rc_title = "[%s](%s)  \n" % (title, msg_body.get("link"))
-                    else:
-                        rc_title = title
-                if text:
-                    rc_text = text
-                else:
-                    rc_text = ""
-                if self._breaks:
-                    trim_text = self.new_line_after_2space_pattern.sub('\n', rc_text)
-                    rc_text = str.replace(trim_text, '\n', '  \n')
-                self.apobj.notify(
-                    body=rc_text,
-                    title=rc_title,
-                )
-            except Exception as msg_e:
-                logger.error(f"apprise 消息发送失败，{str(msg_e)}")
+        # 外部渠道的消息不处理
+        if msg_body.get("channel"):
+            return
+        msg_type: NotificationType = msg_body.get("type")
+        # 检查消息类型是否已启用
+        if msg_type and self._msgtypes and msg_type.name not in self._msgtypes:
+            logger.info(f"消息类型 {msg_type.value} 未开启消息发送")
+            return
 
-            # 标记任务完成
-            self.message_queue.task_done()
+        try:
+            msg_type_value = msg_type.value if msg_type else None
+            rc_title = self._renderer.render_title(msg_body.get("title"), link=msg_body.get("link"),
+                                                   msg_type=msg_type_value) or None
+            rc_text = self._renderer.render_text(msg_body.get("text"), msg_type=msg_type_value)
+        except Exception as msg_e:
+            logger.error(f"apprise 消息渲染失败，{str(msg_e)}")
+            return
+        # 将消息加入各渠道的队列
+        if self._dispatcher:
+            self._dispatcher.put(rc_title, rc_text)
+            logger.info("消息已加入队列等待发送")
 
     def stop_service(self):
         """
         退出插件
         """
-        self.__event.set()
\ No newline at end of file
+        if self._dispatcher:
+            self._dispatcher.stop()
+            self._dispatcher = None
@@ -0,0 +1,150 @@
+import asyncio
+import threading
+from time import time
+from typing import List, Optional, Tuple
+
+import apprise
+
+from app.log import logger
+
+
+class NotifyLane:
+    """
+    单个通知渠道的发送通道：独立的消息队列，按该渠道自己的间隔和超时时间发送，
+    慢速或被限流的渠道不影响其它渠道
+    """
+
+    def __init__(self, url: str, interval: float = 5, timeout: float = 30):
+        """
+        :param url: 通知渠道URL
+        :param interval: 发送间隔（秒）
+        :param timeout: 单条消息发送超时时间（秒）
+        """
+        self.interval = interval
+        self.timeout = timeout
+        self._apobj = apprise.Apprise()
+        if not self._apobj.add(url):
+            raise ValueError(f"无效的通知渠道URL：{url}")
+        # 隐藏敏感信息的渠道名称
+        self.name = self._apobj[0].url(privacy=True)
+        self._queue: Optional[asyncio.Queue] = None
+        self._last_send_time = 0
+        # 正在发送中的消息
+        self._sending = False
+
+    def put_nowait(self, message: Tuple[Optional[str], str]):
+        """
+        消息入队，需在事件循环线程中调用
+        """
+        self._queue.put_nowait(message)
+
+    def pending(self) -> int:
+        """
+        未发送完成的消息数，包括发送中的消息
+        """
+        return (self._queue.qsize() if self._queue else 0) + (1 if self._sending else 0)
+
+    async def join(self):
+        """
+        等待队列中的消息全部发送完成
+        """
+        if self._queue:
+            await self._queue.join()
+
+    async def run(self):
+        self._queue = asyncio.Queue()
+        while True:
+            title, body = await self._queue.get()
+            self._sending = True
+            try:
+                # 检查是否满足发送间隔时间
+                wait = self.interval - (time() - self._last_send_time)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                if not await asyncio.wait_for(self._apobj.async_notify(body=body, title=title), timeout=self.timeout):
+                    logger.warn(f"apprise 消息发送至 {self.name} 失败")
+            except asyncio.TimeoutError:
+                logger.warn(f"apprise 消息发送至 {self.name} 超时（{self.timeout}秒）")
+            except Exception as msg_e:
+                logger.error(f"apprise 消息发送至 {self.name} 失败，{str(msg_e)}")
+            finally:
+                self._sending = False
+                self._last_send_time = time()
+                self._queue.task_done()
+
+
+class NotifyDispatcher:
+    """
+    在独立线程中运行asyncio事件循环，每个通知渠道一个协程，同一条消息并发发送至所有渠道
+    """
+
+    def __init__(self, lanes: List[NotifyLane]):
+        self._lanes = lanes
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        # 停止中，不再接收新消息
+        self._closing = False
+
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def __run():
+            asyncio.set_event_loop(self._loop)
+            tasks = [self._loop.create_task(lane.run()) for lane in self._lanes]
+            # 各通道的队列在协程首次运行时创建
+            self._loop.call_soon(ready.set)
+            try:
+                self._loop.run_forever()
+            finally:
+                for task in tasks:
+                    task.cancel()
+                self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+                self._loop.close()
+                logger.info("消息发送线程正在退出...")
+
+        self._thread = threading.Thread(target=__run, name="AppriseExtMsg", daemon=True)
+        self._thread.start()
+        ready.wait(timeout=5)
+
+    def put(self, title: Optional[str], body: str):
+        """
+        消息加入所有渠道的队列，可在任意线程调用
+        """
+        if not self._loop or self._loop.is_closed() or self._closing:
+            return
+        try:
+            for lane in self._lanes:
+                self._loop.call_soon_threadsafe(lane.put_nowait, (title, body))
+        except RuntimeError:
+            # 事件循环已停止
+            pass
+
+    async def __drain(self, timeout: float) -> List[Tuple[str, int]]:
+        """
+        在超时时间内等待各渠道发送完队列中的消息，返回仍未发送的渠道及消息数
+        """
+        try:
+            await asyncio.wait_for(asyncio.gather(*[lane.join() for lane in self._lanes]), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        return [(lane.name, lane.pending()) for lane in self._lanes if lane.pending()]
+
+    def stop(self, timeout: float = 5):
+        """
+        停止发送：先在超时时间内发送各渠道队列中剩余的消息，仍未发送的消息丢弃并记录数量
+        """
+        if self._loop and not self._loop.is_closed():
+            self._closing = True
+            try:
+                remains = asyncio.run_coroutine_threadsafe(self.__drain(timeout),
+                                                           self._loop).result(timeout=timeout + 1)
+            except Exception as e:
+                logger.error(f"apprise 等待消息发送完成失败：{str(e)}")
+                remains = []
+            for name, count in remains:
+                logger.warn(f"apprise 渠道 {name} 有 {count} 条消息未发送，已丢弃")
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
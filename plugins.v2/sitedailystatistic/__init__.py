@@ -1,17 +1,27 @@
+import csv
+import heapq
+import io
+import json
+import time
+import uuid
 import warnings
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime, timedelta
-from threading import Lock
+from threading import Lock, Thread, Timer
 from typing import Optional, Any, List, Dict, Tuple
 
 import pytz
 from app.helper.sites import SitesHelper
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from sqlalchemy import func, and_, or_
 
 from app import schemas
 from app.chain.site import SiteChain
 from app.core.config import settings
 from app.core.event import eventmanager, Event
+from app.db import SessionFactory
 from app.db.models.site import Site
 from app.db.models.siteuserdata import SiteUserData
 from app.schemas import SiteUserData as SSiteUserData
@@ -34,7 +44,7 @@ class SiteDailyStatistic(_PluginBase):
     # 插件图标
     plugin_icon = "Collabora_A.png"
     # 插件版本
-    plugin_version = "4.0"
+    plugin_version = "4.12"
     # 插件作者
     plugin_author = "Xiang"
     # 作者主页
@@ -54,7 +64,49 @@ class SiteDailyStatistic(_PluginBase):
     _onlyonce: bool = False
     _dashboard_type: str = "today"
     _notify_type = ""
+    _notify_top: int = 0
+    _notify_min_size: int = 0
+    _anomaly_notify: bool = False
+    _queue_cnt: int = 5
+    _refresh_timeout: int = 120
+    _retry_failed: bool = False
+    _retry_interval: int = 10
+    _retry_max_interval: int = 120
+    # 当前失败重试次数及重试任务ID
+    _retry_attempt: int = 0
+    _retry_job_id: Optional[str] = None
     _scheduler = None
+    # 站点刷新线程池
+    _executor: Optional[ThreadPoolExecutor] = None
+    # 批量刷新任务，保留最近的任务状态
+    _refresh_jobs: Dict[str, dict] = {}
+    _max_refresh_jobs: int = 20
+    _job_lock = Lock()
+    # 导出字段
+    _export_fields = ["day", "domain", "name", "username", "user_level", "upload", "download", "ratio", "bonus",
+                      "seeding", "seeding_size", "leeching", "leeching_size", "err_msg"]
+    # 导出差值字段
+    _export_delta_fields = ["upload", "download", "bonus", "seeding", "seeding_size"]
+    # 导出每次查询的行数
+    _export_page_size = 500
+    # 各站点最新数据状态，用于监控指标和通知，prev为该站点上一天的数据
+    _site_state: Dict[str, dict] = {}
+    # 上次全部刷新后由单站点事件更新过的站点
+    _state_updated_sites: set = set()
+    # 监控指标：插件发起的刷新统计、站点刷新事件数
+    _refresh_stats: Dict[str, dict] = {}
+    _refreshed_events: int = 0
+    _metrics_lock = Lock()
+    # 通知合并窗口（秒），窗口内的多次刷新事件只发送一次通知
+    _notify_window: int = 30
+    _notify_timer: Optional[Timer] = None
+    # 各站点每日增量的滚动均值和方差及当天已通知的异常，
+    # {domain: {"last_day": str, "upload": {n, mean, var}, "ratio": {...}, "alerted": {"day": str, "kinds": []}}}
+    _anomaly_stats: Dict[str, dict] = {}
+    # 滚动窗口天数、开始检测前需要的天数、判定异常的标准差倍数
+    _anomaly_window: int = 30
+    _anomaly_min_days: int = 7
+    _anomaly_zscore: float = 3.0
 
     def init_plugin(self, config: dict = None):
         self.siteoper = SiteOper()
@@ -70,6 +122,22 @@ class SiteDailyStatistic(_PluginBase):
             self._onlyonce = config.get("onlyonce")
             self._dashboard_type = config.get("dashboard_type") or "today"
             self._notify_type = config.get("notify_type") or ""
+            self._notify_top = int(config.get("notify_top") or 0)
+            self._notify_min_size = int(config.get("notify_min_size") or 0)
+            notify_window = config.get("notify_window")
+            self._notify_window = int(notify_window) if notify_window not in (None, "") else 30
+            self._anomaly_notify = config.get("anomaly_notify") or False
+            self._queue_cnt = int(config.get("queue_cnt") or 5)
+            self._refresh_timeout = int(config.get("refresh_timeout") or 120)
+            self._retry_failed = config.get("retry_failed") or False
+            self._retry_interval = int(config.get("retry_interval") or 10)
+            self._retry_max_interval = int(config.get("retry_max_interval") or 120)
+
+        if self._enabled or self._notify_type:
+            # 加载异常检测统计
+            self._anomaly_stats = self.get_data("anomaly_stats") or {}
+            # 加载站点数据状态
+            self.__load_site_state()
 
         if self._onlyonce:
             config["onlyonce"] = False
@@ -104,6 +172,30 @@ class SiteDailyStatistic(_PluginBase):
             "methods": ["GET"],
             "summary": "刷新站点今日数据",
             "description": "刷新对应域名的站点今日数据",
+        }, {
+            "path": "/refresh_daily_batch",
+            "endpoint": self.refresh_batch,
+            "methods": ["GET"],
+            "summary": "批量刷新站点今日数据",
+            "description": "后台并发刷新多个域名（逗号分隔）或指定日期以来刷新失败的站点，返回任务ID",
+        }, {
+            "path": "/refresh_daily_job",
+            "endpoint": self.refresh_job_status,
+            "methods": ["GET"],
+            "summary": "查询批量刷新任务状态",
+            "description": "查询批量刷新任务各站点状态，stream=true时以NDJSON逐个推送站点结果",
+        }, {
+            "path": "/export_daily",
+            "endpoint": self.export_daily,
+            "methods": ["GET"],
+            "summary": "导出站点每日数据",
+            "description": "以CSV或NDJSON流式导出每个站点每天的数据及与前一天的差值，可按游标续传",
+        }, {
+            "path": "/metrics",
+            "endpoint": self.metrics,
+            "methods": ["GET"],
+            "summary": "站点数据监控指标",
+            "description": "以Prometheus文本格式输出各站点数据及刷新统计，数据来自内存快照",
         }]
 
     def get_service(self) -> List[Dict[str, Any]]:
@@ -160,6 +252,22 @@ class SiteDailyStatistic(_PluginBase):
                                         }
                                     }
                                 ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSwitch',
+                                        'props': {
+                                            'model': 'retry_failed',
+                                            'label': '失败站点重试',
+                                        }
+                                    }
+                                ]
                             }
                         ]
                     },
@@ -170,7 +278,7 @@ class SiteDailyStatistic(_PluginBase):
                                 'component': 'VCol',
                                 'props': {
                                     'cols': 12,
-                                    'md': 6
+                                    'md': 4
                                 },
                                 'content': [
                                     {
@@ -191,7 +299,7 @@ class SiteDailyStatistic(_PluginBase):
                                 'component': 'VCol',
                                 'props': {
                                     'cols': 12,
-                                    'md': 6
+                                    'md': 4
                                 },
                                 'content': [
                                     {
@@ -207,6 +315,151 @@ class SiteDailyStatistic(_PluginBase):
                                         }
                                     }
                                 ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'notify_window',
+                                            'label': '通知合并窗口（秒）',
+                                            'placeholder': '30，窗口内的多次刷新只发送一次通知，0为不合并'
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'notify_top',
+                                            'label': '通知站点数量',
+                                            'placeholder': '按上传量列出前N个站点，0为全部'
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'notify_min_size',
+                                            'label': '通知最小数据量（MB）',
+                                            'placeholder': '上传和下载量均小于该值的站点合并到其他站点'
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSwitch',
+                                        'props': {
+                                            'model': 'anomaly_notify',
+                                            'label': '站点数据异常通知',
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'queue_cnt',
+                                            'label': '批量刷新并发数量',
+                                            'placeholder': '5'
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'refresh_timeout',
+                                            'label': '单站点刷新超时（秒）',
+                                            'placeholder': '120'
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'retry_interval',
+                                            'label': '失败重试初始间隔（分钟）',
+                                            'placeholder': '10，之后每次翻倍'
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'retry_max_interval',
+                                            'label': '失败重试最长间隔（分钟）',
+                                            'placeholder': '120'
+                                        }
+                                    }
+                                ]
                             }
                         ]
                     }
@@ -215,65 +468,448 @@ class SiteDailyStatistic(_PluginBase):
         ], {
             "enabled": False,
             "onlyonce": False,
-            "dashboard_type": 'today'
+            "dashboard_type": 'today',
+            "notify_top": 0,
+            "notify_min_size": 0,
+            "notify_window": 30,
+            "anomaly_notify": False,
+            "queue_cnt": 5,
+            "refresh_timeout": 120,
+            "retry_failed": False,
+            "retry_interval": 10,
+            "retry_max_interval": 120
         }
 
     @eventmanager.register(EventType.SiteRefreshed)
     def send_msg(self, event: Event):
         """
-        站点数据刷新事件时发送消息
+        站点数据刷新事件时发送消息，合并窗口内的多次刷新事件
         """
         if not self._notify_type:
             return
         if event.event_data.get('site_id') != "*":
             return
-        # 获取站点数据
-        today, today_data, yesterday_data = self.__get_data()
-        # 转换为字典
-        today_data_dict = {data.name: data for data in today_data}
-        yesterday_data_dict = {data.name: data for data in yesterday_data}
-        # 消息内容
-        messages = {}
+        with self._metrics_lock:
+            if self._notify_timer and self._notify_timer.is_alive():
+                logger.debug("站点数据统计通知已在等待发送，合并本次刷新事件")
+                return
+            self._notify_timer = Timer(self._notify_window, self.__send_notify)
+            self._notify_timer.daemon = True
+            self._notify_timer.start()
+
+    def __send_notify(self):
+        """
+        根据各站点数据状态生成并发送统计消息
+        """
+        with self._metrics_lock:
+            self._notify_timer = None
+            states = [dict(state) for state in self._site_state.values() if state.get("day")]
+        if not states:
+            return
+        # 数据最新的日期及前一天
+        today = max(state["day"] for state in states)
+        yesterday = (datetime.strptime(today, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
+        # 今天的日期
+        today_date = datetime.now().strftime("%Y-%m-%d")
+        # 站点数据：(站点标题, 上传量, 下载量)
+        sites = []
         # 总上传
         incUploads = 0
         # 总下载
         incDownloads = 0
-        # 今天的日期
-        today_date = datetime.now().strftime("%Y-%m-%d")
-
-        for rand, site in enumerate(today_data_dict.keys()):
-            upload = int(today_data_dict[site].upload or 0)
-            download = int(today_data_dict[site].download or 0)
-            updated_date = today_data_dict[site].updated_day
-
-            if self._notify_type == "inc" and yesterday_data_dict.get(site):
-                upload -= int(yesterday_data_dict[site].upload or 0)
-                download -= int(yesterday_data_dict[site].download or 0)
 
-            if updated_date and updated_date != today_date:
-                updated_date = f"（{updated_date}）"
-            else:
-                updated_date = ""
+        for state in states:
+            if state["day"] != today:
+                continue
+            upload = int(state.get("upload") or 0)
+            download = int(state.get("download") or 0)
+            prev = state.get("prev")
+            if self._notify_type == "inc" and prev and prev.get("day") == yesterday:
+                upload -= int(prev.get("upload") or 0)
+                download -= int(prev.get("download") or 0)
 
             if upload > 0 or download > 0:
                 incUploads += upload
                 incDownloads += download
-                messages[upload + (rand / 1000)] = (
-                        f"【{site}】{updated_date}\n"
-                        + f"上传量：{StringUtils.str_filesize(upload)}\n"
-                        + f"下载量：{StringUtils.str_filesize(download)}\n"
-                        + "————————————"
-                )
+                sites.append((f"【{state.get('name')}】", upload, download))
 
         if incDownloads or incUploads:
-            sorted_messages = [messages[key] for key in sorted(messages.keys(), reverse=True)]
-            sorted_messages.insert(0, f"【汇总】\n"
+            sorted_messages = self.__digest_messages(sites)
+            sorted_messages.insert(0, f"【汇总】{f'（{today}）' if today != today_date else ''}\n"
                                       f"总上传：{StringUtils.str_filesize(incUploads)}\n"
                                       f"总下载：{StringUtils.str_filesize(incDownloads)}\n"
                                       f"————————————")
             self.post_message(mtype=NotificationType.SiteMessage,
                               title="站点数据统计", text="\n".join(sorted_messages))
 
+    def __digest_messages(self, sites: List[Tuple[str, int, int]]) -> List[str]:
+        """
+        生成站点消息，按上传量列出前N个且数据量达到阈值的站点，其余站点合并为一条
+        :param sites: 站点列表，(站点标题, 上传量, 下载量)
+        """
+        min_size = self._notify_min_size * 1024 * 1024
+        candidates = [site for site in sites if max(site[1], site[2]) >= min_size] if min_size else sites
+        if self._notify_top:
+            top_sites = heapq.nlargest(self._notify_top, candidates, key=lambda x: x[1])
+        else:
+            top_sites = sorted(candidates, key=lambda x: x[1], reverse=True)
+        messages = [
+            f"{title}\n"
+            f"上传量：{StringUtils.str_filesize(upload)}\n"
+            f"下载量：{StringUtils.str_filesize(download)}\n"
+            f"————————————"
+            for title, upload, download in top_sites
+        ]
+        others = len(sites) - len(top_sites)
+        if others > 0:
+            other_upload = sum(site[1] for site in sites) - sum(site[1] for site in top_sites)
+            other_download = sum(site[2] for site in sites) - sum(site[2] for site in top_sites)
+            messages.append(f"【其他 {others} 个站点】\n"
+                            f"上传量：{StringUtils.str_filesize(other_upload)}\n"
+                            f"下载量：{StringUtils.str_filesize(other_download)}\n"
+                            f"————————————")
+        return messages
+
+    @eventmanager.register(EventType.SiteRefreshed)
+    def retry_failed(self, event: Event):
+        """
+        站点数据全部刷新后，按指数退避重试刷新失败的站点
+        """
+        if not self._enabled or not self._retry_failed:
+            return
+        if event.event_data.get('site_id') != "*":
+            return
+        self._retry_attempt = 0
+        self.__schedule_retry()
+
+    def __get_scheduler(self) -> BackgroundScheduler:
+        """
+        获取插件内部定时器，未启动时启动
+        """
+        if not self._scheduler:
+            self._scheduler = BackgroundScheduler(timezone=settings.TZ)
+        if not self._scheduler.running:
+            self._scheduler.start()
+        return self._scheduler
+
+    def __schedule_retry(self):
+        """
+        按重试次数计算下一次重试时间，超过当天23:59则不再重试
+        """
+        now = datetime.now(tz=pytz.timezone(settings.TZ))
+        delay = min(self._retry_interval * 2 ** self._retry_attempt, self._retry_max_interval)
+        run_date = now + timedelta(minutes=delay)
+        cutoff = now.replace(hour=23, minute=59, second=0, microsecond=0)
+        if run_date >= cutoff:
+            logger.info(f"下次重试时间 {run_date.strftime('%H:%M:%S')} 已超过今日截止时间，停止重试失败站点")
+            return
+        self.__get_scheduler().add_job(self.__retry_failed_sites, "date",
+                                       run_date=run_date,
+                                       id="SiteDailyStatisticRetry",
+                                       replace_existing=True,
+                                       name="站点每日数据统计失败重试")
+        logger.info(f"将于 {run_date.strftime('%H:%M:%S')} 重试刷新失败站点")
+
+    def __retry_failed_sites(self):
+        """
+        仅重试今日没有成功数据的站点
+        """
+        job = self._refresh_jobs.get(self._retry_job_id) if self._retry_job_id else None
+        if job and job["status"] != "finished":
+            # 上一轮重试仍在执行，顺延
+            self.__schedule_retry()
+            return
+        today = datetime.now(tz=pytz.timezone(settings.TZ)).strftime("%Y-%m-%d")
+        failed_domains = self.__get_failed_domains(since=today)
+        if not failed_domains:
+            logger.info("所有站点今日均已刷新成功，停止重试")
+            return
+        self._retry_attempt += 1
+        logger.info(f"第 {self._retry_attempt} 次重试刷新失败站点：{'、'.join(failed_domains)}")
+        self._retry_job_id = self.__start_refresh_job(failed_domains)
+        self.__schedule_retry()
+
+    @eventmanager.register(EventType.SiteRefreshed)
+    def update_site_state(self, event: Event):
+        """
+        站点数据刷新事件时更新站点数据状态
+        """
+        if not self._enabled and not self._notify_type:
+            return
+        site_id = event.event_data.get('site_id')
+        with self._metrics_lock:
+            self._refreshed_events += 1
+        if site_id == "*":
+            with self._metrics_lock:
+                updated = bool(self._state_updated_sites)
+                self._state_updated_sites = set()
+            # 未收到单站点刷新事件时从数据库重新加载
+            if not updated:
+                self.__load_site_state()
+            return
+        site = self.siteoper.get(site_id) if site_id else None
+        if not site:
+            return
+        with SessionFactory() as db:
+            data = (db.query(SiteUserData)
+                    .filter(SiteUserData.domain == site.domain)
+                    .order_by(SiteUserData.updated_day.desc(), SiteUserData.updated_time.desc())
+                    .first())
+            if data:
+                db.expunge(data)
+        if data:
+            self.__update_site_state(data)
+            with self._metrics_lock:
+                self._state_updated_sites.add(data.domain)
+
+    def __load_site_state(self):
+        """
+        以各站点最近三天的数据初始化站点数据状态，前两天的数据用于补齐滚动统计及当天的异常检测
+        """
+        try:
+            latest_data = self.__get_latest_userdata()
+            if not latest_data:
+                return
+            today = max(data.updated_day for data in latest_data.values())
+            since = (datetime.strptime(today, "%Y-%m-%d") - timedelta(days=2)).strftime("%Y-%m-%d")
+            with SessionFactory() as db:
+                recent_data: List[SiteUserData] = (db.query(SiteUserData)
+                                                   .filter(SiteUserData.updated_day >= since)
+                                                   .order_by(SiteUserData.updated_day, SiteUserData.updated_time)
+                                                   .all())
+                db.expunge_all()
+            with self._metrics_lock:
+                self._site_state = {}
+            # 按日期顺序写入，最新一天之前的数据依次成为prev
+            for data in recent_data + list(latest_data.values()):
+                self.__update_site_state(data)
+        except Exception as e:
+            logger.error(f"加载站点数据状态失败：{str(e)}")
+
+    def __update_site_state(self, data: SiteUserData):
+        """
+        更新单个站点的数据状态，日期变化时保留上一天的数据，获取失败的数据不更新状态
+        开启异常检测时，每次刷新都以当天数据对比前一天的数据检测异常，同一异常当天只通知一次；
+        日期变化时上一天的增量已完整，计入滚动统计
+        """
+        if data.err_msg or not data.updated_day:
+            return
+
+        def __number(value: Any) -> float:
+            try:
+                return float(value or 0)
+            except (TypeError, ValueError):
+                return 0
+
+        alerts, anomaly_stats = [], None
+        with self._metrics_lock:
+            metrics = self._site_state.setdefault(data.domain, {})
+            stats_changed = False
+            if metrics.get("day"):
+                if data.updated_day < metrics["day"]:
+                    # 旧数据不覆盖
+                    return
+                if data.updated_day > metrics["day"]:
+                    if self._anomaly_notify and self.__is_prev_day(metrics.get("prev"), metrics["day"]):
+                        stats_changed = self.__fold_anomaly_stats(domain=data.domain, cur=metrics,
+                                                                  prev=metrics["prev"])
+                    metrics["prev"] = {
+                        "day": metrics["day"],
+                        "upload": metrics.get("upload"),
+                        "download": metrics.get("download"),
+                        "ratio": metrics.get("ratio"),
+                        "bonus": metrics.get("bonus")
+                    }
+            metrics.update({
+                "day": data.updated_day,
+                "time": data.updated_time,
+                "name": data.name,
+                "upload": __number(data.upload),
+                "download": __number(data.download),
+                "ratio": __number(data.ratio),
+                "bonus": __number(data.bonus),
+                "seeding": __number(data.seeding),
+                "seeding_size": __number(data.seeding_size),
+            })
+            try:
+                success_time = datetime.strptime(f"{data.updated_day} {data.updated_time or '00:00:00'}",
+                                                 "%Y-%m-%d %H:%M:%S").timestamp()
+                metrics["last_success"] = max(success_time, metrics.get("last_success") or 0)
+            except ValueError:
+                pass
+            if self._anomaly_notify and self.__is_prev_day(metrics.get("prev"), metrics["day"]):
+                alerts = self.__check_anomaly(domain=data.domain, cur=metrics, prev=metrics["prev"])
+            if stats_changed or alerts:
+                anomaly_stats = json.loads(json.dumps(self._anomaly_stats))
+        if alerts:
+            self.post_message(mtype=NotificationType.SiteMessage,
+                              title=f"【站点 {data.name} 数据异常】",
+                              text="\n".join(alerts))
+        if anomaly_stats is not None:
+            self.save_data("anomaly_stats", anomaly_stats)
+
+    @staticmethod
+    def __is_prev_day(prev: Optional[dict], day: str) -> bool:
+        """
+        prev是否为day的前一天的数据，间隔多天的数据不作为一天的增量
+        """
+        if not prev or not prev.get("day") or not day:
+            return False
+        try:
+            return (datetime.strptime(day, "%Y-%m-%d")
+                    - datetime.strptime(prev["day"], "%Y-%m-%d")) == timedelta(days=1)
+        except ValueError:
+            return False
+
+    @staticmethod
+    def __welford(stats: dict, value: float, window: int):
+        """
+        增量更新均值和方差，样本数达到窗口大小后按窗口大小加权，近似滚动窗口
+        """
+        n = min(stats.get("n", 0) + 1, window)
+        mean = stats.get("mean", 0.0)
+        delta = value - mean
+        mean += delta / n
+        stats.update({
+            "n": n,
+            "mean": mean,
+            "var": stats.get("var", 0.0) + (delta * (value - mean) - stats.get("var", 0.0)) / n
+        })
+
+    def __fold_anomaly_stats(self, domain: str, cur: dict, prev: dict) -> bool:
+        """
+        已完整的一天的上传量及分享率增量计入滚动统计，累计数据减少的一天不计入，返回是否有更新
+        :param cur: 已完整的一天的数据
+        :param prev: 其前一天的数据
+        """
+        stats = self._anomaly_stats.setdefault(domain, {})
+        if stats.get("last_day") and stats["last_day"] >= cur["day"]:
+            return False
+        stats["last_day"] = cur["day"]
+        upload_delta = (cur.get("upload") or 0) - (prev.get("upload") or 0)
+        download_delta = (cur.get("download") or 0) - (prev.get("download") or 0)
+        if upload_delta >= 0 and download_delta >= 0:
+            self.__welford(stats.setdefault("upload", {}), upload_delta, self._anomaly_window)
+        if prev.get("ratio"):
+            self.__welford(stats.setdefault("ratio", {}), (cur.get("ratio") or 0) - prev["ratio"],
+                           self._anomaly_window)
+        return True
+
+    def __check_anomaly(self, domain: str, cur: dict, prev: dict) -> List[str]:
+        """
+        检测站点当天的增量是否异常：上传下载量减少、上传量骤降为0、分享率骤降、魔力值清零，返回当天尚未通知过的异常
+        上传量按当天已过去的时间比例与近期日均上传比较，当天过半后才检测
+        :param cur: 当天数据
+        :param prev: 前一天数据
+        """
+
+        def __size(value: float) -> str:
+            return f"-{StringUtils.str_filesize(-value)}" if value < 0 else StringUtils.str_filesize(value)
+
+        stats = self._anomaly_stats.setdefault(domain, {})
+        alerts = []
+        # 上传下载量减少
+        upload_delta = (cur.get("upload") or 0) - (prev.get("upload") or 0)
+        download_delta = (cur.get("download") or 0) - (prev.get("download") or 0)
+        if upload_delta < 0 or download_delta < 0:
+            alerts.append(("decrease", f"{cur['day']} 上传量变化 {__size(upload_delta)}，"
+                                       f"下载量变化 {__size(download_delta)}，累计数据减少，可能是账号异常或解析错误"))
+        else:
+            upload_stats = stats.get("upload") or {}
+            try:
+                hour, minute, second = (int(x) for x in (cur.get("time") or "00:00:00").split(":"))
+                elapsed = (hour * 3600 + minute * 60 + second) / 86400
+            except ValueError:
+                elapsed = 0
+            if elapsed >= 0.5 and upload_stats.get("n", 0) >= self._anomaly_min_days and upload_stats["mean"] > 0:
+                # 到当前时间为止的预期上传量及标准差
+                expected = upload_stats["mean"] * elapsed
+                std = (upload_stats["var"] * elapsed) ** 0.5
+                if upload_delta == 0:
+                    alerts.append(("zero_upload", f"{cur['day']} 截至 {cur.get('time')} 上传量为0，"
+                                                  f"近期日均上传 {__size(upload_stats['mean'])}"))
+                elif std > 0 and (upload_delta - expected) / std < -self._anomaly_zscore:
+                    alerts.append(("low_upload", f"{cur['day']} 截至 {cur.get('time')} 上传量 {__size(upload_delta)}，"
+                                                 f"远低于近期日均上传 {__size(upload_stats['mean'])}"))
+        # 分享率骤降
+        if prev.get("ratio"):
+            ratio_delta = (cur.get("ratio") or 0) - prev["ratio"]
+            ratio_stats = stats.get("ratio") or {}
+            std = ratio_stats.get("var", 0) ** 0.5
+            if (cur.get("ratio") or 0) < prev["ratio"] / 2 \
+                    or (ratio_stats.get("n", 0) >= self._anomaly_min_days and std > 0
+                        and (ratio_delta - ratio_stats["mean"]) / std < -self._anomaly_zscore):
+                alerts.append(("ratio", f"{cur['day']} 分享率由 {prev['ratio']:.2f} "
+                                        f"降至 {(cur.get('ratio') or 0):.2f}"))
+        # 魔力值清零
+        if (prev.get("bonus") or 0) > 0 and (cur.get("bonus") or 0) < prev["bonus"] * 0.1:
+            alerts.append(("bonus", f"{cur['day']} 魔力值由 {prev['bonus']:,.1f} "
+                                    f"降至 {(cur.get('bonus') or 0):,.1f}，可能已被清零"))
+        # 同一异常当天只通知一次
+        alerted = stats.get("alerted") or {}
+        if alerted.get("day") != cur["day"]:
+            alerted = {"day": cur["day"], "kinds": []}
+        new_alerts = [text for kind, text in alerts if kind not in alerted["kinds"]]
+        if new_alerts:
+            alerted["kinds"] += [kind for kind, _ in alerts if kind not in alerted["kinds"]]
+            stats["alerted"] = alerted
+        return new_alerts
+
+    def __record_refresh(self, domain: str, success: bool, duration: float):
+        """
+        记录插件发起的站点刷新次数、失败次数及耗时
+        """
+        with self._metrics_lock:
+            stats = self._refresh_stats.setdefault(domain, {"attempts": 0, "failures": 0, "duration": 0.0})
+            stats["attempts"] += 1
+            stats["duration"] += duration
+            if not success:
+                stats["failures"] += 1
+
+    def metrics(self, apikey: str) -> Any:
+        """
+        以Prometheus文本格式输出监控指标，可由API调用
+        """
+        if apikey != settings.API_TOKEN:
+            return schemas.Response(success=False, message="API密钥错误")
+
+        def __label(value: Any) -> str:
+            return str(value or "").replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+        gauges = [
+            ("upload_bytes", "upload", "站点累计上传量"),
+            ("download_bytes", "download", "站点累计下载量"),
+            ("ratio", "ratio", "站点分享率"),
+            ("bonus", "bonus", "站点魔力值"),
+            ("seeding", "seeding", "站点做种数"),
+            ("seeding_size_bytes", "seeding_size", "站点做种体积"),
+            ("last_success_timestamp_seconds", "last_success", "站点最近一次成功刷新时间"),
+        ]
+        counters = [
+            ("refresh_attempts_total", "attempts", "插件发起的站点刷新次数"),
+            ("refresh_failures_total", "failures", "插件发起的站点刷新失败次数"),
+            ("refresh_duration_seconds_total", "duration", "插件发起的站点刷新累计耗时"),
+        ]
+        lines = []
+        with self._metrics_lock:
+            for metric, key, desc in gauges:
+                lines.append(f"# HELP sitedailystatistic_{metric} {desc}")
+                lines.append(f"# TYPE sitedailystatistic_{metric} gauge")
+                for domain, metrics in self._site_state.items():
+                    if metrics.get(key) is None:
+                        continue
+                    lines.append(f'sitedailystatistic_{metric}{{domain="{__label(domain)}",'
+                                 f'name="{__label(metrics.get("name"))}"}} {metrics[key]}')
+            for metric, key, desc in counters:
+                lines.append(f"# HELP sitedailystatistic_{metric} {desc}")
+                lines.append(f"# TYPE sitedailystatistic_{metric} counter")
+                for domain, stats in self._refresh_stats.items():
+                    lines.append(f'sitedailystatistic_{metric}{{domain="{__label(domain)}"}} {stats[key]}')
+            lines.append("# HELP sitedailystatistic_site_refreshed_events_total 收到的站点刷新事件数")
+            lines.append("# TYPE sitedailystatistic_site_refreshed_events_total counter")
+            lines.append(f"sitedailystatistic_site_refreshed_events_total {self._refreshed_events}")
+        return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
     def __get_data(self) -> Tuple[str, List[SiteUserData], List[SiteUserData]]:
         """
         获取今天的日期、今天的站点数据、昨天的站点数据
@@ -985,6 +1621,12 @@ class SiteDailyStatistic(_PluginBase):
                 if self._scheduler.running:
                     self._scheduler.shutdown()
                 self._scheduler = None
+            if self._executor:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+            if self._notify_timer:
+                self._notify_timer.cancel()
+                self._notify_timer = None
         except Exception as e:
             logger.error("退出插件失败：%s" % str(e))
 
@@ -1012,49 +1654,436 @@ class SiteDailyStatistic(_PluginBase):
             message=f"站点 {domain} 不存在"
         )
     
+    def refresh_batch(self, apikey: str, domains: str = None, failed_since: str = None) -> schemas.Response:
+        """
+        批量刷新站点数据，可由API调用，立即返回任务ID
+        :param apikey: API密钥
+        :param domains: 站点域名，多个以英文逗号分隔
+        :param failed_since: 日期（YYYY-MM-DD），刷新该日期以来没有成功数据的已启用站点
+        """
+        if apikey != settings.API_TOKEN:
+            return schemas.Response(success=False, message="API密钥错误")
+        domain_list = [domain.strip() for domain in (domains or "").split(",") if domain.strip()]
+        if failed_since:
+            try:
+                datetime.strptime(failed_since, "%Y-%m-%d")
+            except ValueError:
+                return schemas.Response(success=False, message=f"日期 {failed_since} 格式错误，应为YYYY-MM-DD")
+            domain_list += [domain for domain in self.__get_failed_domains(since=failed_since)
+                            if domain not in domain_list]
+        # 去重并保持顺序
+        domain_list = list(dict.fromkeys(domain_list))
+        if not domain_list:
+            return schemas.Response(success=False, message="没有需要刷新的站点")
+        job_id = self.__start_refresh_job(domain_list)
+        return schemas.Response(
+            success=True,
+            message=f"已提交 {len(domain_list)} 个站点的刷新任务",
+            data={"job_id": job_id, "domains": domain_list}
+        )
+
+    def refresh_job_status(self, job_id: str, apikey: str, stream: bool = False) -> Any:
+        """
+        查询批量刷新任务状态，可由API调用
+        :param job_id: 任务ID
+        :param apikey: API密钥
+        :param stream: 是否以NDJSON流逐个返回站点结果，直到任务结束
+        """
+        if apikey != settings.API_TOKEN:
+            return schemas.Response(success=False, message="API密钥错误")
+        job = self._refresh_jobs.get(job_id)
+        if not job:
+            return schemas.Response(success=False, message=f"任务 {job_id} 不存在")
+        if stream:
+            return StreamingResponse(self.__stream_refresh_job(job), media_type="application/x-ndjson")
+        with self._job_lock:
+            return schemas.Response(success=True, data=self.__job_snapshot(job))
+
+    @staticmethod
+    def __job_snapshot(job: dict) -> dict:
+        """
+        任务状态快照
+        """
+        return {
+            "job_id": job["job_id"],
+            "status": job["status"],
+            "create_time": job["create_time"],
+            "sites": [dict(state) for state in job["sites"].values()]
+        }
+
+    def __stream_refresh_job(self, job: dict):
+        """
+        逐个推送已结束的站点状态，任务结束后推送任务汇总
+        """
+        sent = set()
+        while True:
+            with self._job_lock:
+                finished = job["status"] == "finished"
+                states = [dict(state) for domain, state in job["sites"].items()
+                          if domain not in sent and state["status"] not in ("pending", "running")]
+            for state in states:
+                sent.add(state["domain"])
+                yield json.dumps(state, ensure_ascii=False) + "\n"
+            if finished:
+                break
+            time.sleep(0.5)
+        with self._job_lock:
+            summary = self.__job_snapshot(job)
+        summary.pop("sites")
+        yield json.dumps(summary, ensure_ascii=False) + "\n"
+
+    def __start_refresh_job(self, domains: List[str]) -> str:
+        """
+        创建批量刷新任务并在后台执行
+        """
+        job_id = uuid.uuid4().hex
+        job = {
+            "job_id": job_id,
+            "status": "running",
+            "create_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "sites": {domain: {"domain": domain, "status": "pending", "message": ""} for domain in domains}
+        }
+        with self._job_lock:
+            # 清理最早结束的任务
+            finished_jobs = [jid for jid, j in self._refresh_jobs.items() if j["status"] == "finished"]
+            while len(self._refresh_jobs) >= self._max_refresh_jobs and finished_jobs:
+                self._refresh_jobs.pop(finished_jobs.pop(0), None)
+            self._refresh_jobs[job_id] = job
+        Thread(target=self.__run_refresh_job, args=(job,), daemon=True).start()
+        return job_id
+
+    def __get_executor(self) -> ThreadPoolExecutor:
+        """
+        站点刷新线程池，所有批量任务共享，限制总并发数
+        """
+        with self._job_lock:
+            if not self._executor:
+                self._executor = ThreadPoolExecutor(max_workers=max(self._queue_cnt, 1),
+                                                    thread_name_prefix="SiteDailyStatistic")
+            return self._executor
+
+    def __run_refresh_job(self, job: dict):
+        """
+        执行批量刷新任务，超时的站点标记为超时，不再等待其结果
+        整个任务的截止时间按站点数和线程数估算，到期后仍在排队的站点也标记为超时，任务随即结束
+        注意：站点刷新无法被中断，已超时的站点仍占用一个刷新线程直到其请求返回，期间线程池可用线程相应减少
+        """
+        try:
+            executor = self.__get_executor()
+            futures = {executor.submit(self.__refresh_site, state): state for state in job["sites"].values()}
+        except RuntimeError as e:
+            # 插件已停止，线程池已关闭
+            logger.warn(f"批量刷新任务 {job['job_id']} 无法执行：{str(e)}")
+            futures = {}
+        # 所有站点按线程数分批、每批用满单站点超时时间的耗时
+        rounds = -(-len(futures) // max(self._queue_cnt, 1))
+        job_timeout = self._refresh_timeout * max(rounds, 1)
+        deadline = time.time() + job_timeout
+        pending = set(futures)
+        while pending:
+            _, pending = wait(pending, timeout=1, return_when=FIRST_COMPLETED)
+            now = time.time()
+            for future in list(pending):
+                state = futures[future]
+                with self._job_lock:
+                    if state["status"] == "running" and now - state["start_time"] > self._refresh_timeout:
+                        state.update({
+                            "status": "timeout",
+                            "message": f"刷新超过 {self._refresh_timeout} 秒未完成",
+                            "cost": round(now - state["start_time"], 2)
+                        })
+                        pending.discard(future)
+                    elif now > deadline:
+                        # 任务已到截止时间，取消仍在排队的站点
+                        future.cancel()
+                        state.update({
+                            "status": "timeout",
+                            "message": f"批量刷新任务超过 {job_timeout} 秒未完成，站点未开始刷新"
+                            if state["status"] == "pending" else f"批量刷新任务超过 {job_timeout} 秒未完成",
+                            "cost": round(now - state["start_time"], 2) if state.get("start_time") else None
+                        })
+                        pending.discard(future)
+        with self._job_lock:
+            # 被取消或未能执行的站点
+            for state in job["sites"].values():
+                if state["status"] in ("pending", "running"):
+                    state.update({"status": "cancelled", "message": "任务已取消"})
+            job["status"] = "finished"
+        logger.info(f"批量刷新任务 {job['job_id']} 完成，"
+                    f"成功 {len([s for s in job['sites'].values() if s['status'] == 'success'])}/{len(job['sites'])}")
+
+    def __refresh_site(self, state: dict):
+        """
+        刷新单个站点并记录状态
+        """
+        domain = state["domain"]
+        with self._job_lock:
+            # 任务已到截止时间的站点不再刷新
+            if state["status"] != "pending":
+                return
+            state.update({"status": "running", "start_time": time.time()})
+        status, message, data = "failed", "", None
+        try:
+            site_info = self.siteshelper.get_indexer(domain)
+            if not site_info:
+                status, message = "not_found", f"站点 {domain} 不存在"
+            else:
+                site_data = self.sitechain.refresh_userdata(site=site_info)
+                if site_data and not site_data.err_msg:
+                    status, message, data = "success", f"站点 {domain} 刷新成功", site_data.dict()
+                else:
+                    message = (site_data.err_msg if site_data else "") or f"站点 {domain} 刷新数据失败，未获取到数据"
+        except Exception as e:
+            message = f"站点 {domain} 刷新失败：{str(e)}"
+            logger.error(message)
+        self.__record_refresh(domain=domain, success=status == "success",
+                              duration=time.time() - state["start_time"])
+        with self._job_lock:
+            # 已判定超时的站点不再更新状态
+            if state["status"] != "running":
+                return
+            state.update({
+                "status": status,
+                "message": message,
+                "data": data,
+                "cost": round(time.time() - state["start_time"], 2)
+            })
+
+    def export_daily(self, apikey: str, fmt: str = "ndjson", start: str = None, end: str = None,
+                     domain: str = None, cursor: str = None) -> Any:
+        """
+        流式导出站点每日数据，可由API调用
+        :param apikey: API密钥
+        :param fmt: 导出格式，csv/ndjson
+        :param start: 开始日期（YYYY-MM-DD），包含
+        :param end: 结束日期（YYYY-MM-DD），包含
+        :param domain: 仅导出该域名的站点
+        :param cursor: 续传游标，为已导出最后一行的cursor字段，从其后一行继续导出
+        """
+        if apikey != settings.API_TOKEN:
+            return schemas.Response(success=False, message="API密钥错误")
+        if fmt not in ("csv", "ndjson"):
+            return schemas.Response(success=False, message=f"不支持的导出格式 {fmt}，仅支持csv/ndjson")
+        for date in (start, end):
+            if date:
+                try:
+                    datetime.strptime(date, "%Y-%m-%d")
+                except ValueError:
+                    return schemas.Response(success=False, message=f"日期 {date} 格式错误，应为YYYY-MM-DD")
+        after = None
+        if cursor:
+            after = tuple(cursor.split("/", 1))
+            if len(after) != 2:
+                return schemas.Response(success=False, message=f"游标 {cursor} 无效")
+        rows = self.__iter_export_rows(start=start, end=end, domain=domain, after=after)
+        if fmt == "csv":
+            content, media_type = self.__encode_csv(rows), "text/csv"
+        else:
+            content, media_type = (json.dumps(row, ensure_ascii=False) + "\n" for row in rows), "application/x-ndjson"
+        filename = f"sitedailystatistic_{datetime.now().strftime('%Y%m%d%H%M%S')}.{fmt}"
+        return StreamingResponse(content, media_type=media_type,
+                                 headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+    def __encode_csv(self, rows):
+        """
+        逐行编码为CSV
+        """
+        header = ["cursor"] + self._export_fields + [f"delta_{field}" for field in self._export_delta_fields]
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(header)
+        for row in rows:
+            writer.writerow([row.get(field) for field in header])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+    def __iter_export_rows(self, start: Optional[str], end: Optional[str], domain: Optional[str],
+                           after: Optional[Tuple[str, str]]):
+        """
+        按（站点, 日期）顺序分页读取数据，每个站点每天保留最后一条，并计算与该站点上一天的差值
+        """
+
+        def __number(value: Any) -> Optional[float]:
+            try:
+                return float(value) if value is not None and value != "" else None
+            except (TypeError, ValueError):
+                return None
+
+        def __query(db, cursor: Optional[Tuple[str, str]]):
+            query = db.query(SiteUserData)
+            if start:
+                query = query.filter(SiteUserData.updated_day >= start)
+            if end:
+                query = query.filter(SiteUserData.updated_day <= end)
+            if domain:
+                query = query.filter(SiteUserData.domain == domain)
+            if cursor:
+                query = query.filter(or_(SiteUserData.domain > cursor[0],
+                                         and_(SiteUserData.domain == cursor[0],
+                                              SiteUserData.updated_day > cursor[1])))
+            return query.order_by(SiteUserData.domain, SiteUserData.updated_day, SiteUserData.updated_time)
+
+        def __to_row(data: SiteUserData, prev: Optional[dict]) -> dict:
+            row = {"cursor": f"{data.domain}/{data.updated_day}", "day": data.updated_day}
+            row.update({field: getattr(data, field, None) for field in self._export_fields if field != "day"})
+            for field in self._export_delta_fields:
+                current, last = __number(row.get(field)), __number(prev.get(field)) if prev else None
+                row[f"delta_{field}"] = current - last if current is not None and last is not None else None
+            return row
+
+        # 续传时取游标所在行作为差值基准
+        prev_row = None
+        if after:
+            with SessionFactory() as db:
+                last = (db.query(SiteUserData)
+                        .filter(SiteUserData.domain == after[0], SiteUserData.updated_day == after[1])
+                        .order_by(SiteUserData.updated_time.desc())
+                        .first())
+                if last:
+                    prev_row = __to_row(last, None)
+
+        cursor = after
+        while True:
+            with SessionFactory() as db:
+                page: List[SiteUserData] = __query(db, cursor).limit(self._export_page_size).all()
+                db.expunge_all()
+            if not page:
+                break
+            # 同一站点同一天保留最后一条
+            groups: Dict[Tuple[str, str], SiteUserData] = {}
+            for data in page:
+                groups[(data.domain, data.updated_day)] = data
+            keys = list(groups.keys())
+            # 本页最后一组可能被截断，留到下一页读取（单组超过一页时直接输出）
+            if len(page) == self._export_page_size and len(keys) > 1:
+                keys.pop()
+            for key in keys:
+                data = groups[key]
+                if prev_row and prev_row["domain"] != data.domain:
+                    prev_row = None
+                prev_row = __to_row(data, prev_row)
+                yield prev_row
+            cursor = keys[-1]
+            if len(page) < self._export_page_size:
+                break
+
+    def __get_failed_domains(self, since: str) -> List[str]:
+        """
+        获取指定日期以来没有成功刷新数据的已启用站点域名
+        """
+        active_domains = [site.domain for site in self.siteoper.list_active() or []]
+        if not active_domains:
+            return []
+        with SessionFactory() as db:
+            success_domains = {
+                row.domain for row in db.query(SiteUserData.domain).filter(
+                    SiteUserData.updated_day >= since,
+                    or_(SiteUserData.err_msg.is_(None), SiteUserData.err_msg == "")
+                ).distinct().all()
+            }
+        return [domain for domain in active_domains if domain not in success_domains]
+
     def refresh_all_sites(self):
-        # 获取最近所有数据
-        data_list: List[SiteUserData] = self.siteoper.get_userdata()
-        if data_list:
-            # 获取所有站点名称
-            all_sites_with_domain = {f"{data.domain}" : data.name for data in data_list}
-            all_sites = [domain for domain in all_sites_with_domain.keys() if self.siteoper.exists(domain)]
-            all_sites = [all_sites_with_domain[domain] for domain in all_sites if self.siteoper.get_by_domain(domain).is_active == 1]
-
-            # 每个日期、每个站点只保留最后一条数据
-            data_list = list({f"{data.updated_day}_{data.name}": data for data in data_list}.values())
-            # 按日期倒序排序
-            data_list.sort(key=lambda x: x.updated_day, reverse=True)
+        """
+        以各站点最近一次的数据补全今日缺失的已启用站点数据，然后刷新所有站点
+        """
+        # 已启用站点（一次查询）
+        active_domains = {site.domain for site in self.siteoper.list_active() or []}
+        # 各站点最新一条数据（一次分组查询）
+        latest_data = self.__get_latest_userdata()
+        if active_domains and latest_data:
             # 获取今天的日期
-            today = data_list[0].updated_day
-            # 如果站点没有今天的数据，就用昨天的数据填充为今天的数据
-            for site in all_sites:
-                site_data_list = [data for data in data_list if data.name == site]
-                if site_data_list and site_data_list[0].updated_day != today:
-                    newest_site_data = site_data_list[0]
-                    logger.info(f"站点{newest_site_data.name}没有今日（{today}）数据，开始以 {newest_site_data.updated_day} 的数据填充")
+            today = max(data.updated_day for data in latest_data.values())
+            # 如果站点没有今天的数据，就用最近一次的数据填充为今天的数据
+            fill_data = [data for domain, data in latest_data.items()
+                         if domain in active_domains and data.updated_day != today]
+            if fill_data:
+                logger.info(f"{len(fill_data)} 个站点没有今日（{today}）数据，开始以最近一次的数据填充："
+                            f"{'、'.join(data.name for data in fill_data)}")
+                count = self.__fill_userdata(today=today, data_list=fill_data)
+                logger.info(f"{count} 个站点以最近一次的数据填充今日（{today}）数据成功")
+        self.sitechain.refresh_userdatas()
+
+    @staticmethod
+    def __get_latest_userdata() -> Dict[str, SiteUserData]:
+        """
+        分组查询各站点最新一天的数据，同一天有多条时取最后更新的一条，返回 {domain: SiteUserData}
+        """
+        with SessionFactory() as db:
+            subquery = (
+                db.query(
+                    SiteUserData.domain,
+                    func.max(SiteUserData.updated_day).label("latest_day")
+                )
+                .group_by(SiteUserData.domain)
+                .subquery()
+            )
+            data_list: List[SiteUserData] = (
+                db.query(SiteUserData)
+                .join(subquery, and_(SiteUserData.domain == subquery.c.domain,
+                                     SiteUserData.updated_day == subquery.c.latest_day))
+                .order_by(SiteUserData.updated_time)
+                .all()
+            )
+            # 查询结果在会话关闭后仍需读取属性
+            db.expunge_all()
+        return {data.domain: data for data in data_list}
+
+    @staticmethod
+    def __fill_userdata(today: str, data_list: List[SiteUserData]) -> int:
+        """
+        在一个事务中批量写入补全数据，已存在今日数据的站点保留原数据，返回写入条数
+        """
+        if not data_list:
+            return 0
+        current_time = datetime.now().strftime("%H:%M:%S")
+        with SessionFactory() as db:
+            try:
+                # 事务内再次确认，避免覆盖刚刷新到的今日数据
+                exists_domains = {
+                    row.domain for row in db.query(SiteUserData.domain).filter(
+                        SiteUserData.updated_day == today,
+                        SiteUserData.domain.in_([data.domain for data in data_list])
+                    ).all()
+                }
+                count = 0
+                for data in data_list:
+                    if data.domain in exists_domains:
+                        continue
                     payload = SSiteUserData(
-                        domain=newest_site_data.domain,
-                        userid=newest_site_data.userid,
-                        username=newest_site_data.username,
-                        user_level=newest_site_data.user_level,
-                        join_at=newest_site_data.join_at,
-                        upload=newest_site_data.upload,
-                        download=newest_site_data.download,
-                        ratio=newest_site_data.ratio,
-                        bonus=newest_site_data.bonus,
-                        seeding=newest_site_data.seeding,
-                        seeding_size=newest_site_data.seeding_size,
-                        seeding_info=newest_site_data.seeding_info or [],
-                        leeching=newest_site_data.leeching,
-                        leeching_size=newest_site_data.leeching_size,
-                        message_unread=newest_site_data.message_unread,
-                        message_unread_contents=newest_site_data.message_unread_contents or [],
+                        domain=data.domain,
+                        userid=data.userid,
+                        username=data.username,
+                        user_level=data.user_level,
+                        join_at=data.join_at,
+                        upload=data.upload,
+                        download=data.download,
+                        ratio=data.ratio,
+                        bonus=data.bonus,
+                        seeding=data.seeding,
+                        seeding_size=data.seeding_size,
+                        seeding_info=data.seeding_info or [],
+                        leeching=data.leeching,
+                        leeching_size=data.leeching_size,
+                        message_unread=data.message_unread,
+                        message_unread_contents=data.message_unread_contents or [],
                         updated_day=today,
-                        err_msg=newest_site_data.err_msg
+                        err_msg=data.err_msg
                     ).dict()
-                    self.siteoper.update_userdata(domain=newest_site_data.domain,
-                                          name=newest_site_data.name,
-                                          payload=payload)
-                    logger.info(f"站点{newest_site_data.name}没有今日（{today}）数据，以 {newest_site_data.updated_day} 的数据填充成功")
-        self.sitechain.refresh_userdatas()
\ No newline at end of file
+                    payload.update({
+                        "domain": data.domain,
+                        "name": data.name,
+                        "updated_day": today,
+                        "updated_time": current_time,
+                        "err_msg": data.err_msg or ""
+                    })
+                    db.add(SiteUserData(**{k: v for k, v in payload.items() if hasattr(SiteUserData, k)}))
+                    count += 1
+                db.commit()
+                return count
+            except Exception as e:
+                db.rollback()
+                logger.error(f"补全站点今日数据失败：{str(e)}")
+                return 0
@@ -1,12 +1,27 @@
-from typing import Any, List, Dict, Tuple
-from urllib.parse import quote_plus
+import hashlib
+import hmac
+import time
+from typing import Any, List, Dict, Tuple, Optional
+from urllib.parse import quote_plus, urlparse
 
+from fastapi.responses import FileResponse
+
+from app import schemas
+from app.core.config import settings
 from app.core.event import eventmanager, Event
 from app.log import logger
 from app.plugins import _PluginBase
 from app.schemas.types import EventType, NotificationType
 from app.utils.http import RequestUtils
-import re
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .batcher import MessageBatcher
+from .delivery import DeliveryQueue, RateLimiter, TargetStats
+from .imagecache import ImageCache
+from .outbox import Outbox
+from .renderer import MessageRenderer
 
 
 class XiangHookMsg(_PluginBase):
@@ -17,7 +32,7 @@ class XiangHookMsg(_PluginBase):
     # 插件图标
     plugin_icon = "Rocketchat_A.png"
     # 插件版本
-    plugin_version = "2.2"
+    plugin_version = "3.10"
     # 插件作者
     plugin_author = "Xiang"
     # 作者主页
@@ -28,8 +43,6 @@ class XiangHookMsg(_PluginBase):
     plugin_order = 30
     # 可使用的用户级别
     auth_level = 1
-    # 换行符替换正则
-    new_line_after_2space_pattern = re.compile(' *\n')
 
     # 私有属性
     _enabled = False
@@ -37,10 +50,65 @@ class XiangHookMsg(_PluginBase):
     _apikey = None
     _msgtypes = []
     _subpath = '/hooks'
+    # 其他发送目标，每行一个：webhook地址 [消息类型,...]
+    _targets = None
+    # 解析后的发送目标
+    _target_list: List[dict] = []
+    # 各目标发送统计
+    _target_stats: Optional[TargetStats] = None
     # convert '\n' to "  \n"(add two spaces)
     _breaks = False 
+    # 投递队列长度
+    _queue_size = 100
+    # 发送线程数
+    _workers = 2
+    # 队列满时的处理策略
+    _overflow = "drop_oldest"
+    # 消息投递队列
+    _queue: Optional[DeliveryQueue] = None
+    # 发送失败的最大重试次数，0为不重试
+    _retry_times = 10
+    # 发送失败消息的重试箱
+    _outbox: Optional[Outbox] = None
+    # 连接池大小
+    _pool_size = 4
+    # 请求超时时间（秒）
+    _timeout = 10
+    # 长连接会话，服务器或连接池大小变化时重建
+    _session: Optional[requests.Session] = None
+    _session_key = None
+    # 消息合并时间窗口（秒），0为不合并
+    _batch_window = 0
+    # 合并消息的最大长度
+    _batch_max_size = 4000
+    _batcher: Optional[MessageBatcher] = None
+    # 消息模板
+    _title_template = None
+    _link_template = None
+    _text_template = None
+    _renderer: Optional[MessageRenderer] = None
+    # 图片缓存
+    _image_cache_enabled = False
+    # 图片最大宽度
+    _image_max_width = 800
+    # 图片缓存大小（MB）
+    _image_cache_size = 100
+    # 使用代理下载图片
+    _image_proxy = False
+    # 图片访问地址，webhook接收端经此地址获取缓存的图片
+    _image_base_url = None
+    _image_cache: Optional[ImageCache] = None
+    # 每个目标每分钟最多发送数量，0为不限速
+    _rate_limit = 0
+    # 限速允许的突发数量
+    _rate_burst = 5
+    # 优先发送的消息类型
+    _high_types = ["Manual", "Download"]
+    # 最后发送的消息类型
+    _low_types = ["SiteMessage"]
 
     def init_plugin(self, config: dict = None):
+        self.__stop_delivery()
         if config:
             self._enabled = config.get("enabled")
             self._msgtypes = config.get("msgtypes") or []
@@ -48,19 +116,211 @@ class XiangHookMsg(_PluginBase):
             self._apikey = config.get("apikey")
             self._breaks = config.get("breaks") or False
             self._subpath = config.get("subPath") or "/hooks"
+            self._targets = config.get("targets")
+            self._queue_size = int(config.get("queue_size") or 100)
+            self._workers = int(config.get("workers") or 2)
+            self._overflow = config.get("overflow") or "drop_oldest"
+            retry_times = config.get("retry_times")
+            self._retry_times = int(retry_times) if retry_times not in (None, "") else 10
+            self._pool_size = int(config.get("pool_size") or 4)
+            self._timeout = int(config.get("timeout") or 10)
+            self._batch_window = float(config.get("batch_window") or 0)
+            self._batch_max_size = int(config.get("batch_max_size") or 4000)
+            self._title_template = config.get("title_template")
+            self._link_template = config.get("link_template")
+            self._text_template = config.get("text_template")
+            self._image_cache_enabled = config.get("image_cache") or False
+            self._image_max_width = int(config.get("image_max_width") or 800)
+            self._image_cache_size = int(config.get("image_cache_size") or 100)
+            self._image_proxy = config.get("image_proxy") or False
+            self._image_base_url = config.get("image_base_url")
+            self._rate_limit = int(config.get("rate_limit") or 0)
+            self._rate_burst = int(config.get("rate_burst") or 5)
+            self._high_types = config.get("high_types", ["Manual", "Download"]) or []
+            self._low_types = config.get("low_types", ["SiteMessage"]) or []
         if self._subpath.endswith('/') or self._subpath.startswith('/'):
             self._subpath = self._subpath.strip('/')
+        self._target_list = self.__parse_targets()
+        self._target_stats = TargetStats()
+        self.__init_session()
+        # 预编译消息模板
+        self._renderer = MessageRenderer(
+            title=MessageRenderer.try_compile(self._title_template, "# {title}") + "  \n",
+            link_title=MessageRenderer.try_compile(self._link_template, "[{title}]({link})") + "  \n",
+            text=MessageRenderer.try_compile(self._text_template, "{text}") + " \n",
+            breaks=self._breaks)
+        if self.get_state():
+            if self._image_cache_enabled:
+                self._image_cache = ImageCache(cache_dir=self.get_data_path() / "images",
+                                               max_bytes=self._image_cache_size * 1024 * 1024,
+                                               max_width=self._image_max_width,
+                                               proxy=self._image_proxy)
+                if not self.__image_base_url():
+                    logger.warn("未设置图片访问地址，图片缓存不生效")
+            else:
+                self._image_cache = None
+            workers = max(self._workers, len(self._target_list))
+            self._queue = DeliveryQueue(handler=self.__deliver,
+                                        maxsize=self._queue_size,
+                                        workers=workers,
+                                        policy=self._overflow,
+                                        spill_path=self.get_data_path() / "spill.jsonl",
+                                        limiter=RateLimiter(per_minute=self._rate_limit, burst=self._rate_burst)
+                                        if self._rate_limit > 0 else None,
+                                        # 每个目标最多占用平均分配的发送线程，无响应的目标不影响其它目标
+                                        per_target=max(1, workers // max(len(self._target_list), 1)))
+            self._queue.start()
+            if self._retry_times > 0:
+                self._outbox = Outbox(db_path=self.get_data_path() / "outbox.db",
+                                      sender=self.__replay,
+                                      max_attempts=self._retry_times)
+                self._outbox.start()
+            if self._batch_window > 0:
+                self._batcher = MessageBatcher(flush=self.__flush_batch,
+                                               window=self._batch_window,
+                                               max_size=self._batch_max_size)
+
+
+    def __parse_targets(self) -> List[dict]:
+        """
+        发送目标：主目标及其他目标，每个目标包含地址、名称（隐藏token）及消息类型
+        """
+        targets = []
+        if self._server and self._apikey:
+            targets.append({
+                "url": "%s/%s/%s" % (self._server, self._subpath, self._apikey),
+                "msgtypes": self._msgtypes
+            })
+        for line in (self._targets or "").split("\n"):
+            parts = line.strip().split(maxsplit=1)
+            if not parts:
+                continue
+            if not parts[0].startswith("http"):
+                logger.warn(f"发送目标 {parts[0]} 不是有效的地址")
+                continue
+            targets.append({
+                "url": parts[0],
+                "msgtypes": [t.strip() for t in parts[1].split(",") if t.strip()] if len(parts) > 1 else []
+            })
+        for target in targets:
+            target["name"] = self.__target_name(target["url"])
+        return targets
+
+    @staticmethod
+    def __target_name(url: str) -> str:
+        """
+        目标名称，隐藏地址中最后一段的token，仅用于日志及统计展示，同一服务器的多个目标名称可能相同
+        """
+        parsed = urlparse(url)
+        return f"{parsed.netloc}{parsed.path.rsplit('/', 1)[0]}/***"
+
+    @staticmethod
+    def __match_type(target: dict, msg_type: Optional[NotificationType]) -> bool:
+        """
+        目标是否接收该类型消息，消息类型可配置为名称或中文名称
+        """
+        if not msg_type or not target.get("msgtypes"):
+            return True
+        return msg_type.name in target["msgtypes"] or msg_type.value in target["msgtypes"]
 
+    def __init_session(self):
+        """
+        初始化长连接会话，配置未变化时沿用原会话
+        """
+        hosts = {urlparse(target["url"]).netloc for target in self._target_list}
+        session_key = (tuple(sorted(hosts)), self._pool_size) if self.get_state() else None
+        if session_key == self._session_key and (self._session or not session_key):
+            return
+        self.__close_session()
+        if session_key:
+            session = requests.Session()
+            # 每个目标主机一个连接池
+            adapter = HTTPAdapter(pool_connections=max(len(hosts), 1), pool_maxsize=self._pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._session = session
+        self._session_key = session_key
+
+    def __close_session(self):
+        if self._session:
+            self._session.close()
+            self._session = None
+        self._session_key = None
 
     def get_state(self) -> bool:
-        return self._enabled and (True if self._server and self._apikey else False)
+        return self._enabled and (True if self._target_list else False)
 
     @staticmethod
     def get_command() -> List[Dict[str, Any]]:
         pass
 
     def get_api(self) -> List[Dict[str, Any]]:
-        pass
+        return [{
+            "path": "/metrics",
+            "endpoint": self.metrics,
+            "methods": ["GET"],
+            "summary": "投递队列统计",
+            "description": "消息投递队列深度、发送数量及延迟",
+        }, {
+            "path": "/image",
+            "endpoint": self.image,
+            "methods": ["GET"],
+            "summary": "缓存的图片",
+            "description": "webhook接收端获取缓存的消息图片，地址带签名",
+        }]
+
+    def image(self, name: str, sign: str):
+        """
+        获取缓存的图片，由消息中的图片地址访问，以签名代替API密钥，避免密钥随消息外发
+        """
+        if not self._image_cache or not hmac.compare_digest(sign or "", self.__image_sign(name or "")):
+            return schemas.Response(success=False, message="图片不存在")
+        path = self._image_cache.lookup(name)
+        if not path:
+            return schemas.Response(success=False, message="图片不存在")
+        return FileResponse(path, media_type="image/jpeg", headers={"Cache-Control": "max-age=86400"})
+
+    @staticmethod
+    def __image_sign(name: str) -> str:
+        return hmac.new(str(settings.API_TOKEN).encode("utf-8"), name.encode("utf-8"), hashlib.sha256).hexdigest()[:16]
+
+    def __image_base_url(self) -> Optional[str]:
+        """
+        图片访问地址，未设置时使用系统的访问域名
+        """
+        base_url = self._image_base_url or getattr(settings, "APP_DOMAIN", None)
+        if not base_url:
+            return None
+        if not base_url.startswith("http"):
+            base_url = f"http://{base_url}"
+        return base_url.rstrip("/")
+
+    def __cached_image_url(self, image: str) -> Optional[str]:
+        """
+        图片缓存后的访问地址，缓存失败时返回None
+        """
+        base_url = self.__image_base_url()
+        if not base_url:
+            return None
+        path = self._image_cache.get(image)
+        if not path:
+            return None
+        return (f"{base_url}/api/v1/plugin/{self.__class__.__name__}/image"
+                f"?name={path.name}&sign={self.__image_sign(path.name)}")
+
+    def metrics(self, apikey: str) -> schemas.Response:
+        """
+        投递队列统计，可由API调用
+        """
+        if apikey != settings.API_TOKEN:
+            return schemas.Response(success=False, message="API密钥错误")
+        if not self._queue:
+            return schemas.Response(success=False, message="插件未启用")
+        data = self._queue.metrics()
+        if self._outbox:
+            data["outbox_pending"] = self._outbox.pending()
+        data["targets"] = self._target_stats.snapshot([(target["url"], target["name"]) for target in self._target_list])
+        return schemas.Response(success=True, data=data)
 
     def get_form(self) -> Tuple[List[dict], Dict[str, Any]]:
         """
@@ -194,6 +454,409 @@ class XiangHookMsg(_PluginBase):
                             }
                         ]
                     },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextarea',
+                                        'props': {
+                                            'model': 'targets',
+                                            'label': '其他发送目标',
+                                            'rows': 3,
+                                            'placeholder': '一行一个webhook地址，可在地址后以空格分隔指定消息类型（逗号分隔），'
+                                                           '例如 https://chat.example.com/hooks/token Manual,Download',
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'queue_size',
+                                            'label': '队列长度',
+                                            'placeholder': '100',
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'workers',
+                                            'label': '发送线程数',
+                                            'placeholder': '2',
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSelect',
+                                        'props': {
+                                            'model': 'overflow',
+                                            'label': '队列满时',
+                                            'items': [
+                                                {'title': '丢弃最早的消息', 'value': 'drop_oldest'},
+                                                {'title': '等待', 'value': 'block'},
+                                                {'title': '暂存到磁盘', 'value': 'spill'}
+                                            ]
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'retry_times',
+                                            'label': '失败重试次数',
+                                            'placeholder': '10，0为不重试',
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'pool_size',
+                                            'label': '连接池大小',
+                                            'placeholder': '4',
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'timeout',
+                                            'label': '超时时间（秒）',
+                                            'placeholder': '10',
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 6
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'batch_window',
+                                            'label': '消息合并窗口（秒）',
+                                            'placeholder': '0为不合并',
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 6
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'batch_max_size',
+                                            'label': '合并消息最大长度',
+                                            'placeholder': '4000',
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'title_template',
+                                            'label': '标题模板',
+                                            'placeholder': '# {title}',
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'link_template',
+                                            'label': '带链接的标题模板',
+                                            'placeholder': '[{title}]({link})',
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'text_template',
+                                            'label': '正文模板',
+                                            'placeholder': '{text}',
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSwitch',
+                                        'props': {
+                                            'model': 'image_cache',
+                                            'label': '缓存图片',
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSwitch',
+                                        'props': {
+                                            'model': 'image_proxy',
+                                            'label': '使用代理下载图片',
+                                        }
+                                    }
+                                ]
+                            },
+                {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'image_max_width',
+                                            'label': '图片最大宽度',
+                                            'placeholder': '800',
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'image_cache_size',
+                                            'label': '图片缓存大小（MB）',
+                                            'placeholder': '100',
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'image_base_url',
+                                            'label': '图片访问地址',
+                                            'placeholder': '留空时使用系统设置的访问域名，如 http://192.168.1.2:3000',
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'rate_limit',
+                                            'label': '每个目标每分钟发送数量',
+                                            'placeholder': '0为不限速',
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'rate_burst',
+                                            'label': '突发数量',
+                                            'placeholder': '5',
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSelect',
+                                        'props': {
+                                            'multiple': True,
+                                            'chips': True,
+                                            'model': 'high_types',
+                                            'label': '优先发送的消息类型',
+                                            'items': MsgTypeOptions
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 3
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSelect',
+                                        'props': {
+                                            'multiple': True,
+                                            'chips': True,
+                                            'model': 'low_types',
+                                            'label': '最后发送的消息类型',
+                                            'items': MsgTypeOptions
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
                 ]
             }
         ], {
@@ -202,7 +865,28 @@ class XiangHookMsg(_PluginBase):
             'msgtypes': [],
             'server': 'https://api.day.app',
             'apikey': '',
-            'subPath': '/hooks'
+            'subPath': '/hooks',
+            'targets': '',
+            'queue_size': 100,
+            'workers': 2,
+            'overflow': 'drop_oldest',
+            'retry_times': 10,
+            'pool_size': 4,
+            'timeout': 10,
+            'batch_window': 0,
+            'batch_max_size': 4000,
+            'title_template': '',
+            'link_template': '',
+            'text_template': '',
+            'image_cache': False,
+            'image_max_width': 800,
+            'image_cache_size': 100,
+            'image_proxy': False,
+            'image_base_url': '',
+            'rate_limit': 0,
+            'rate_burst': 5,
+            'high_types': ['Manual', 'Download'],
+            'low_types': ['SiteMessage']
         }
 
     def get_page(self) -> List[dict]:
@@ -231,46 +915,123 @@ class XiangHookMsg(_PluginBase):
             logger.warn("标题和内容不能同时为空")
             return
 
-        if (msg_type and self._msgtypes
-                and msg_type.name not in self._msgtypes):
+        targets = [target for target in self._target_list if self.__match_type(target, msg_type)]
+        if not targets:
             logger.info(f"消息类型 {msg_type.value} 未开启消息发送")
             return
 
         try:
-            if not self._server or not self._apikey:
-                return False, "参数未配置"
-            rc_url = "%s/%s/%s" % (self._server, self._subpath, self._apikey)
-            rc_text = None
-            if title:
-                if msg_body.get("link"):
-                    rc_text = "[%s](%s)  \n" % (title, msg_body.get("link"))
-                else:
-                    rc_text = "# %s  \n" % title
-            if text:
-                rc_text = "%s%s \n" % (rc_text, text)
-            if self._breaks:
-                trim_text = self.new_line_after_2space_pattern.sub('\n', rc_text)
-                rc_text = str.replace(trim_text, '\n', '  \n')
+            rc_text = self._renderer.render(title, text,
+                                            link=msg_body.get("link"),
+                                            msg_type=msg_type.value if msg_type else None)
             image = msg_body.get("image") or ""
             rc_data = {
                 "text": rc_text,
                 "image": image
             }
-            logger.info(f"发送消息至{rc_url}, 图片：{image}, 内容：{rc_text}")
-            res = RequestUtils(headers={
-                },content_type="application/json").post_res(rc_url, json=rc_data)
-            if res and res.status_code == 200:
-                logger.info("发送成功")
-            elif res is not None:
-                logger.warn(f"错误码：{res.status_code}，错误原因：{res.reason}")
-            else:
-                logger.warn("未获取到返回信息")
+            # 每个目标单独入队，由多个发送线程并发发送
+            for target in targets:
+                # 同类型的文本消息在窗口内合并发送
+                if self._batcher and not image:
+                    self._batcher.add(target["url"], msg_type.name if msg_type else "", rc_text)
+                # 加入投递队列，由发送线程发送，不阻塞事件处理
+                elif self._queue:
+                    self._queue.put({"url": target["url"], "data": dict(rc_data)},
+                                    priority=self.__priority(msg_type.name if msg_type else None))
 
         except Exception as msg_e:
             logger.error(f"Xiang.Chat消息发送失败：{str(msg_e)}")
 
+    def __priority(self, msg_type: Optional[str]) -> int:
+        """
+        消息类型对应的发送优先级
+        """
+        if msg_type in self._high_types:
+            return 0
+        if msg_type in self._low_types:
+            return 2
+        return 1
+
+    def __flush_batch(self, rc_url: str, msg_type: str, texts: List[str]):
+        """
+        合并窗口到期，合并后的消息加入投递队列，队列已停止时直接发送
+        """
+        item = {"url": rc_url, "data": {
+            "text": MessageBatcher.separator.join(texts),
+            "image": ""
+        }}
+        queue = self._queue
+        if queue:
+            queue.put(item, priority=self.__priority(msg_type))
+        else:
+            self.__deliver(item)
+
+    def __deliver(self, item: dict) -> bool:
+        """
+        发送一条队列中的消息，失败时加入重试箱
+        """
+        error = self.__post(item)
+        if not error:
+            return True
+        if self._outbox:
+            self._outbox.add(item, error=error)
+        return False
+
+    def __replay(self, item: dict) -> Optional[str]:
+        """
+        重放重试箱中的消息，与投递队列共用各目标的限速，避免恢复后集中重放
+        """
+        queue = self._queue
+        if queue and not queue.acquire(item):
+            return "等待限速超时或投递队列已停止"
+        return self.__post(item)
+
+    def __post(self, item: dict) -> Optional[str]:
+        """
+        发送消息至webhook，发送成功返回None，失败返回错误信息
+        """
+        rc_url = item.get("url")
+        rc_data = item.get("data")
+        target_name = self.__target_name(rc_url)
+        logger.info(f"发送消息至{target_name}, 图片：{rc_data.get('image')}, 内容：{rc_data.get('text')}")
+        image = rc_data.get("image")
+        if self._image_cache and image and image.startswith("http"):
+            # 使用缓存的图片地址，缓存失败时仍发送原地址
+            cached_image = self.__cached_image_url(image)
+            if cached_image:
+                rc_data = {**rc_data, "image": cached_image}
+        start_time = time.time()
+        res = RequestUtils(headers={
+            }, session=self._session, timeout=self._timeout,
+            content_type="application/json").post_res(rc_url, json=rc_data)
+        error = None
+        if res and res.status_code == 200:
+            logger.info(f"发送至{target_name}成功")
+        elif res is not None:
+            error = f"错误码：{res.status_code}，错误原因：{res.reason}"
+            logger.warn(f"发送至{target_name}失败，{error}")
+        else:
+            error = "未获取到返回信息"
+            logger.warn(f"发送至{target_name}失败，{error}")
+        if self._target_stats:
+            self._target_stats.record(rc_url, success=not error, latency=time.time() - start_time, error=error)
+        return error
+
     def stop_service(self):
         """
         退出插件
         """
-        pass
+        self.__stop_delivery()
+        self.__close_session()
+
+    def __stop_delivery(self):
+        # 先停止合并，待合并的消息进入队列，随队列一起发送或暂存到磁盘
+        if self._batcher:
+            batcher, self._batcher = self._batcher, None
+            batcher.flush_all()
+        if self._queue:
+            queue, self._queue = self._queue, None
+            queue.stop()
+        if self._outbox:
+            self._outbox.stop()
+            self._outbox = None
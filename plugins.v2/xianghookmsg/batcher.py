@@ -0,0 +1,75 @@
+import threading
+from typing import Callable, Dict, List, Tuple
+
+from app.log import logger
+
+
+class MessageBatcher:
+    """
+    消息合并：同一目标、同一消息类型在时间窗口内到达的文本消息合并为一条发送，
+    窗口到期或合并后的长度超过上限时立即发送
+    """
+
+    # 合并消息之间的分隔线
+    separator = "\n---\n"
+
+    def __init__(self, flush: Callable[[str, str, List[str]], None], window: float = 10, max_size: int = 4000):
+        """
+        :param flush: 发送函数，参数为目标URL、消息类型和待合并的文本列表
+        :param window: 合并时间窗口（秒）
+        :param max_size: 合并后文本的最大长度
+        """
+        self._flush = flush
+        self._window = window
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        # (目标URL, 消息类型) -> (文本列表, 总长度, 定时器)
+        self._batches: Dict[Tuple[str, str], Tuple[List[str], int, threading.Timer]] = {}
+
+    def add(self, url: str, msg_type: str, text: str):
+        """
+        加入待合并消息
+        """
+        key = (url, msg_type)
+        flush_texts = None
+        with self._lock:
+            texts, size, timer = self._batches.get(key) or ([], 0, None)
+            if texts and size + len(self.separator) + len(text) > self._max_size:
+                # 超过长度上限，先发送已有的消息
+                timer.cancel()
+                flush_texts = texts
+                texts, size, timer = [], 0, None
+            texts.append(text)
+            size += len(text) + (len(self.separator) if size else 0)
+            if not timer:
+                timer = threading.Timer(self._window, self.__on_timer, args=(key,))
+                timer.daemon = True
+                timer.start()
+            self._batches[key] = (texts, size, timer)
+        if flush_texts:
+            self.__send(url, msg_type, flush_texts)
+
+    def flush_all(self):
+        """
+        立即发送所有待合并的消息
+        """
+        with self._lock:
+            batches = self._batches
+            self._batches = {}
+        for (url, msg_type), (texts, _, timer) in batches.items():
+            timer.cancel()
+            self.__send(url, msg_type, texts)
+
+    def __on_timer(self, key: Tuple[str, str]):
+        with self._lock:
+            batch = self._batches.pop(key, None)
+        if batch:
+            self.__send(key[0], key[1], batch[0])
+
+    def __send(self, url: str, msg_type: str, texts: List[str]):
+        if len(texts) > 1:
+            logger.info(f"合并 {len(texts)} 条消息发送")
+        try:
+            self._flush(url, msg_type, texts)
+        except Exception as e:
+            logger.error(f"合并消息发送失败：{str(e)}")
@@ -0,0 +1,366 @@
+import json
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from app.log import logger
+
+
+class TokenBucket:
+    """
+    令牌桶限速
+    """
+
+    def __init__(self, rate: float, burst: int):
+        """
+        :param rate: 每秒生成的令牌数
+        :param burst: 令牌桶容量，即允许的突发数量
+        """
+        self._rate = rate
+        self._burst = max(burst, 1)
+        self._tokens = float(self._burst)
+        self._updated = time.monotonic()
+
+    def try_acquire(self) -> float:
+        """
+        尝试取得一个令牌，成功返回0，否则返回需要等待的秒数（不消耗令牌）
+        """
+        now = time.monotonic()
+        self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        return (1 - self._tokens) / self._rate
+
+
+class RateLimiter:
+    """
+    按发送目标分别限速，调用方负责加锁
+    """
+
+    def __init__(self, per_minute: int, burst: int = 5):
+        self._rate = per_minute / 60
+        self._burst = burst
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def __call__(self, item: dict) -> float:
+        key = item.get("url")
+        bucket = self._buckets.get(key)
+        if not bucket:
+            bucket = self._buckets[key] = TokenBucket(self._rate, self._burst)
+        return bucket.try_acquire()
+
+
+class DeliveryQueue:
+    """
+    有界消息投递队列：固定数量的发送线程从队列取消息发送，队列满时按策略处理：
+    drop_oldest 丢弃优先级最低的通道中最早的消息（新消息的优先级不高于队列中所有消息时丢弃新消息），block 阻塞等待（超时后丢弃新消息），spill 溢出到磁盘文件，队列空闲时再读回
+    消息按优先级分为多个通道，发送线程总是先取高优先级的消息；设置限速时跳过暂时没有令牌的目标，
+    设置单目标并发数时跳过发送中消息已达上限的目标，避免无响应的目标占满所有发送线程
+    """
+
+    # 优先级：0 高，1 普通，2 低
+    PRIORITIES = (0, 1, 2)
+
+    def __init__(self, handler: Callable[[dict], bool], maxsize: int = 100, workers: int = 2,
+                 policy: str = "drop_oldest", spill_path: Optional[Path] = None, block_timeout: int = 30,
+                 limiter: Optional[Callable[[dict], float]] = None, per_target: int = 0):
+        """
+        :param handler: 发送函数，参数为消息，返回是否发送成功
+        :param maxsize: 队列长度
+        :param workers: 发送线程数
+        :param policy: 队列满时的处理策略 drop_oldest/block/spill
+        :param spill_path: 溢出文件路径
+        :param block_timeout: 阻塞策略的最长等待时间（秒）
+        :param limiter: 限速函数，参数为消息，可以发送时返回0，否则返回需要等待的秒数
+        :param per_target: 每个目标同时发送中的最大消息数，0为不限制
+        """
+        self._handler = handler
+        self._maxsize = max(maxsize, 1)
+        self._workers_cnt = max(workers, 1)
+        self._policy = policy if policy != "spill" or spill_path else "drop_oldest"
+        self._spill_path = spill_path
+        self._block_timeout = block_timeout
+        self._limiter = limiter
+        self._per_target = max(per_target, 0)
+        # 各目标发送中的消息数
+        self._inflight: Dict[str, int] = {}
+        self._lanes: Dict[int, Deque[dict]] = {priority: deque() for priority in self.PRIORITIES}
+        self._cond = threading.Condition()
+        self._stop_event = threading.Event()
+        # 停止中：不再读回溢出文件，队列发送完后线程退出
+        self._closing = False
+        self._workers: List[threading.Thread] = []
+        # 统计
+        self._latencies: Deque[float] = deque(maxlen=500)
+        self._counters: Dict[str, int] = {"enqueued": 0, "sent": 0, "failed": 0, "dropped": 0, "spilled": 0}
+        self._spilled = 0
+
+    def start(self):
+        """
+        启动发送线程，有溢出文件时先读回
+        """
+        if self._spill_path and self._spill_path.exists():
+            self._spilled = sum(1 for line in self._spill_path.open(encoding="utf-8") if line.strip())
+        for i in range(self._workers_cnt):
+            worker = threading.Thread(target=self.__run, name=f"XiangHookMsg-{i}", daemon=True)
+            self._workers.append(worker)
+            worker.start()
+
+    def stop(self, timeout: int = 5):
+        """
+        停止发送线程：先在超时时间内发送队列中剩余的消息，仍未发送的消息写入溢出文件，下次启动时继续发送
+        """
+        deadline = time.time() + timeout
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join(timeout=max(deadline - time.time(), 0))
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join(timeout=1)
+        self._workers = []
+        with self._cond:
+            items = [item for priority in self.PRIORITIES for item in self._lanes[priority]]
+            for lane in self._lanes.values():
+                lane.clear()
+            if not items:
+                return
+            if self._spill_path:
+                self.__spill(items)
+                logger.info(f"{len(items)} 条消息未发送，已暂存到磁盘，下次启动时发送")
+            else:
+                self._counters["dropped"] += len(items)
+                logger.warn(f"{len(items)} 条消息未发送，已丢弃")
+
+    def acquire(self, item: dict, timeout: float = 60) -> bool:
+        """
+        等待消息目标的限速令牌，供队列外的发送（如重试箱重放）与队列共用各目标的限速，
+        超时或队列停止时返回False
+        """
+        if not self._limiter:
+            return True
+        deadline = time.time() + timeout
+        with self._cond:
+            while not self._closing and not self._stop_event.is_set():
+                delay = self._limiter(item)
+                if not delay:
+                    return True
+                remain = deadline - time.time()
+                if remain <= 0:
+                    break
+                self._cond.wait(timeout=min(delay, remain))
+        return False
+
+    def __depth(self) -> int:
+        return sum(len(lane) for lane in self._lanes.values())
+
+    def put(self, item: dict, priority: int = 1) -> bool:
+        """
+        消息入队，立即返回，返回消息是否被接收
+        """
+        item["enqueued_at"] = time.time()
+        item["priority"] = priority if priority in self.PRIORITIES else 1
+        with self._cond:
+            self._counters["enqueued"] += 1
+            if self.__depth() >= self._maxsize:
+                if self._policy == "block":
+                    if not self._cond.wait_for(lambda: self.__depth() < self._maxsize or self._stop_event.is_set(),
+                                               timeout=self._block_timeout) or self._stop_event.is_set():
+                        self._counters["dropped"] += 1
+                        logger.warn("消息队列已满，等待超时，丢弃消息")
+                        return False
+                elif self._policy == "spill":
+                    self.__spill([item])
+                    return True
+                else:
+                    lowest = next(p for p in reversed(self.PRIORITIES) if self._lanes[p])
+                    if item["priority"] >= lowest:
+                        # 新消息的优先级不高于队列中的任何消息，丢弃新消息
+                        self._counters["dropped"] += 1
+                        logger.warn("消息队列已满，丢弃新消息")
+                        return False
+                    # 丢弃优先级最低的通道中最早的消息
+                    self._lanes[lowest].popleft()
+                    self._counters["dropped"] += 1
+                    logger.warn("消息队列已满，丢弃优先级较低的最早消息")
+            self._lanes[item["priority"]].append(item)
+            self._cond.notify_all()
+        return True
+
+    def metrics(self) -> dict:
+        """
+        队列深度、各计数及发送延迟（入队到发送完成，秒）
+        """
+        with self._cond:
+            latencies = sorted(self._latencies)
+            depth = self.__depth()
+            lanes = {priority: len(lane) for priority, lane in self._lanes.items()}
+            counters = dict(self._counters)
+            spilled = self._spilled
+
+        def __percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(int(len(latencies) * p), len(latencies) - 1)], 3)
+
+        return {
+            "depth": depth,
+            "lanes": lanes,
+            "maxsize": self._maxsize,
+            "spill_depth": spilled,
+            "workers": self._workers_cnt,
+            "per_target": self._per_target,
+            "policy": self._policy,
+            **counters,
+            "latency_p50": __percentile(0.5),
+            "latency_p99": __percentile(0.99),
+            "latency_max": round(latencies[-1], 3) if latencies else None
+        }
+
+    def __spill(self, items: List[dict]):
+        """
+        消息追加写入溢出文件，调用时需持有锁
+        """
+        try:
+            with self._spill_path.open("a", encoding="utf-8") as f:
+                for item in items:
+                    f.write(json.dumps(item, ensure_ascii=False) + "\n")
+            self._spilled += len(items)
+            self._counters["spilled"] += len(items)
+        except Exception as e:
+            self._counters["dropped"] += len(items)
+            logger.error(f"消息写入溢出文件失败：{str(e)}")
+
+    def __load_spilled(self):
+        """
+        队列有空位时从溢出文件读回消息，调用时需持有锁
+        """
+        if not self._spilled or self.__depth() >= self._maxsize:
+            return
+        try:
+            lines = [line for line in self._spill_path.read_text(encoding="utf-8").splitlines() if line.strip()]
+        except Exception as e:
+            logger.error(f"读取溢出文件失败：{str(e)}")
+            return
+        count = self._maxsize - self.__depth()
+        for line in lines[:count]:
+            try:
+                item = json.loads(line)
+            except ValueError:
+                continue
+            self._lanes[item.get("priority", 1)].append(item)
+        remain = lines[count:]
+        if remain:
+            self._spill_path.write_text("\n".join(remain) + "\n", encoding="utf-8")
+        else:
+            self._spill_path.unlink(missing_ok=True)
+        self._spilled = len(remain)
+
+    def __take(self) -> Tuple[Optional[dict], float]:
+        """
+        按优先级取出第一条可以发送的消息，没有可发送的消息时返回需要等待的秒数，调用时需持有锁
+        """
+        wait = 1.0
+        blocked = set()
+        for priority in self.PRIORITIES:
+            lane = self._lanes[priority]
+            for index, item in enumerate(lane):
+                key = item.get("url")
+                if key in blocked:
+                    continue
+                if self._per_target and self._inflight.get(key, 0) >= self._per_target:
+                    # 该目标发送中的消息已达上限，等待发送完成后唤醒
+                    blocked.add(key)
+                    continue
+                delay = self._limiter(item) if self._limiter else 0
+                if not delay:
+                    del lane[index]
+                    return item, 0
+                blocked.add(key)
+                wait = min(wait, delay)
+        return None, wait
+
+    def __run(self):
+        while not self._stop_event.is_set():
+            with self._cond:
+                if not self.__depth() and not self._closing:
+                    self.__load_spilled()
+                item, wait = self.__take()
+                if not item:
+                    if self._closing and not self.__depth():
+                        break
+                    self._cond.wait(timeout=wait)
+                    continue
+                key = item.get("url")
+                self._inflight[key] = self._inflight.get(key, 0) + 1
+                # 唤醒阻塞等待的入队
+                self._cond.notify_all()
+            try:
+                success = self._handler(item)
+            except Exception as e:
+                logger.error(f"消息发送失败：{str(e)}")
+                success = False
+            with self._cond:
+                self._counters["sent" if success else "failed"] += 1
+                self._latencies.append(time.time() - item.get("enqueued_at", time.time()))
+                self._inflight[key] -= 1
+                if not self._inflight[key]:
+                    self._inflight.pop(key)
+                # 唤醒等待该目标的发送线程
+                self._cond.notify_all()
+
+
+class TargetStats:
+    """
+    各发送目标的健康状态及发送延迟统计，按目标地址统计，展示时由调用方提供隐藏token的名称
+    """
+
+    def __init__(self, window: int = 200):
+        self._window = window
+        self._lock = threading.Lock()
+        self._stats: Dict[str, dict] = {}
+        self._latencies: Dict[str, Deque[float]] = {}
+
+    def record(self, target: str, success: bool, latency: float, error: str = None):
+        with self._lock:
+            stats = self._stats.setdefault(target, {"sent": 0, "failed": 0, "consecutive_failures": 0,
+                                                    "last_success_at": None, "last_error": None})
+            if success:
+                stats["sent"] += 1
+                stats["consecutive_failures"] = 0
+                stats["last_success_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
+            else:
+                stats["failed"] += 1
+                stats["consecutive_failures"] += 1
+                stats["last_error"] = error
+            self._latencies.setdefault(target, deque(maxlen=self._window)).append(latency)
+
+    def snapshot(self, targets: List[Tuple[str, str]]) -> List[dict]:
+        """
+        各目标统计，连续失败3次及以上视为不健康
+        :param targets: 按顺序展示的目标，(地址, 展示名称)
+        """
+        with self._lock:
+            result = []
+            for index, (target, name) in enumerate(targets):
+                stats = self._stats.get(target)
+                if not stats:
+                    continue
+                latencies = sorted(self._latencies.get(target) or [])
+                result.append({
+                    "index": index,
+                    "name": name,
+                    **stats,
+                    "healthy": stats["consecutive_failures"] < 3,
+                    "latency_p50": round(latencies[len(latencies) // 2], 3) if latencies else None,
+                    "latency_p99": round(latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)], 3)
+                    if latencies else None
+                })
+            return result
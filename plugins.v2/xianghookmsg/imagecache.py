@@ -0,0 +1,130 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+
+from PIL import Image
+
+from app.core.config import settings
+from app.log import logger
+from app.utils.http import RequestUtils
+
+
+class ImageCache:
+    """
+    图片本地缓存：远程图片只下载一次，按最大宽度缩放并压缩为JPEG后保存，按总字节数以最近最少使用淘汰
+    缓存文件由插件API按文件名提供访问
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int = 100 * 1024 * 1024, max_width: int = 800,
+                 quality: int = 80, timeout: int = 10, proxy: bool = False):
+        """
+        :param cache_dir: 缓存目录
+        :param max_bytes: 缓存总大小上限
+        :param max_width: 图片最大宽度，超过时等比缩放
+        :param quality: JPEG压缩质量
+        :param timeout: 下载超时时间（秒）
+        :param proxy: 是否使用代理下载图片
+        """
+        self._cache_dir = cache_dir
+        self._max_bytes = max_bytes
+        self._max_width = max_width
+        self._quality = quality
+        self._timeout = timeout
+        self._proxy = proxy
+        self._lock = threading.Lock()
+        # 文件名 -> 大小，按最近使用排序
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total = 0
+        # 正在下载的图片，避免同一图片并发重复下载
+        self._fetching: Dict[str, threading.Event] = {}
+        self._cache_dir.mkdir(parents=True, exist_ok=True)
+        for file in sorted(self._cache_dir.glob("*.jpg"), key=lambda f: f.stat().st_mtime):
+            size = file.stat().st_size
+            self._entries[file.name] = size
+            self._total += size
+        self.__evict()
+
+    @staticmethod
+    def __key(url: str) -> str:
+        return hashlib.sha1(url.encode("utf-8")).hexdigest() + ".jpg"
+
+    def get(self, url: str) -> Optional[Path]:
+        """
+        获取图片的本地缓存文件，未缓存时下载
+        """
+        name = self.__key(url)
+        while True:
+            with self._lock:
+                if name in self._entries:
+                    self._entries.move_to_end(name)
+                    path = self._cache_dir / name
+                    try:
+                        os.utime(path)
+                        return path
+                    except FileNotFoundError:
+                        self._total -= self._entries.pop(name)
+                event = self._fetching.get(name)
+                if not event:
+                    event = self._fetching[name] = threading.Event()
+                    break
+            # 等待其它线程下载完成后重新读取缓存，下载失败或超时时不再重复下载
+            event.wait(self._timeout * 2)
+            with self._lock:
+                if name not in self._entries:
+                    return None
+        try:
+            content = self.__download(url)
+            if not content:
+                return None
+            path = self._cache_dir / name
+            path.write_bytes(content)
+            with self._lock:
+                self._total += len(content) - self._entries.pop(name, 0)
+                self._entries[name] = len(content)
+                self.__evict()
+            return path
+        finally:
+            with self._lock:
+                self._fetching.pop(name, None)
+            event.set()
+
+    def lookup(self, name: str) -> Optional[Path]:
+        """
+        按文件名获取已缓存的图片，不下载
+        """
+        with self._lock:
+            if name not in self._entries:
+                return None
+            self._entries.move_to_end(name)
+        path = self._cache_dir / name
+        return path if path.exists() else None
+
+    def __download(self, url: str) -> Optional[bytes]:
+        res = RequestUtils(proxies=settings.PROXY if self._proxy else None, timeout=self._timeout).get_res(url)
+        if not res or res.status_code != 200 or not res.content:
+            logger.warn(f"下载图片失败：{url}")
+            return None
+        try:
+            with Image.open(io.BytesIO(res.content)) as img:
+                img = img.convert("RGB")
+                if img.width > self._max_width:
+                    img = img.resize((self._max_width, int(img.height * self._max_width / img.width)))
+                output = io.BytesIO()
+                img.save(output, format="JPEG", quality=self._quality, optimize=True)
+                return output.getvalue()
+        except Exception as e:
+            logger.warn(f"图片 {url} 压缩失败：{str(e)}")
+            return None
+
+    def __evict(self):
+        """
+        超出总大小时删除最久未使用的图片，调用时需持有锁
+        """
+        while self._total > self._max_bytes and self._entries:
+            name, size = self._entries.popitem(last=False)
+            self._total -= size
+            (self._cache_dir / name).unlink(missing_ok=True)
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import random
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from app.log import logger
+
+
+class Outbox:
+    """
+    发送失败消息的持久化重试箱：消息按内容哈希去重保存在SQLite中，由后台线程按指数退避加随机抖动重试，
+    插件重启后立即重放未送达的消息
+    """
+
+    def __init__(self, db_path: Path, sender: Callable[[dict], Optional[str]], max_attempts: int = 10,
+                 base_delay: int = 30, max_delay: int = 3600):
+        """
+        :param db_path: 数据库文件路径
+        :param sender: 发送函数，参数为消息，发送成功返回None，失败返回错误信息
+        :param max_attempts: 最大重试次数，超过后放弃
+        :param base_delay: 首次重试间隔（秒）
+        :param max_delay: 最大重试间隔（秒）
+        """
+        self._db_path = str(db_path)
+        self._sender = sender
+        self._max_attempts = max_attempts
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        with closing(self.__connect()) as conn, conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS outbox ("
+                         "hash TEXT PRIMARY KEY, item TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+                         "next_at REAL NOT NULL, created_at REAL NOT NULL, last_error TEXT)")
+
+    def __connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self._db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @staticmethod
+    def __hash(item: dict) -> str:
+        content = json.dumps({"url": item.get("url"), "data": item.get("data")}, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def __delay(self, attempts: int) -> float:
+        """
+        第attempts次重试前的等待时间，指数退避并加入±50%的随机抖动
+        """
+        delay = min(self._base_delay * (2 ** max(attempts - 1, 0)), self._max_delay)
+        return delay * random.uniform(0.5, 1.5)
+
+    def add(self, item: dict, error: str = None):
+        """
+        保存发送失败的消息，相同内容的消息只保存一次
+        :param item: 消息
+        :param error: 本次发送失败的原因
+        """
+        now = time.time()
+        record = {key: value for key, value in item.items() if key != "enqueued_at"}
+        with self._lock, closing(self.__connect()) as conn, conn:
+            cursor = conn.execute("INSERT OR IGNORE INTO outbox (hash, item, attempts, next_at, created_at, last_error) "
+                                  "VALUES (?, ?, 0, ?, ?, ?)",
+                                  (self.__hash(record), json.dumps(record, ensure_ascii=False),
+                                   now + self.__delay(1), now, error))
+        if cursor.rowcount:
+            logger.info("消息发送失败，已加入重试队列")
+        else:
+            logger.debug("相同消息已在重试队列中")
+
+    def pending(self) -> int:
+        with closing(self.__connect()) as conn:
+            return conn.execute("SELECT COUNT(1) FROM outbox").fetchone()[0]
+
+    def start(self, interval: int = 10):
+        """
+        启动重试线程，未送达的消息立即重放
+        """
+        with self._lock, closing(self.__connect()) as conn, conn:
+            conn.execute("UPDATE outbox SET next_at = ?", (time.time(),))
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self.__run, args=(interval,), name="XiangHookMsg-outbox", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def __due(self, limit: int = 20) -> List[sqlite3.Row]:
+        with closing(self.__connect()) as conn:
+            return conn.execute("SELECT * FROM outbox WHERE next_at <= ? ORDER BY created_at LIMIT ?",
+                                (time.time(), limit)).fetchall()
+
+    def __run(self, interval: int):
+        while not self._stop_event.wait(interval):
+            try:
+                rows = self.__due()
+            except Exception as e:
+                logger.error(f"读取重试队列失败：{str(e)}")
+                continue
+            for row in rows:
+                if self._stop_event.is_set():
+                    break
+                item = json.loads(row["item"])
+                try:
+                    error = self._sender(item)
+                except Exception as e:
+                    error = str(e)
+                success = not error
+                attempts = row["attempts"] + 1
+                with self._lock, closing(self.__connect()) as conn, conn:
+                    if success:
+                        conn.execute("DELETE FROM outbox WHERE hash = ?", (row["hash"],))
+                        logger.info(f"重试第 {attempts} 次发送成功")
+                    elif attempts >= self._max_attempts:
+                        conn.execute("DELETE FROM outbox WHERE hash = ?", (row["hash"],))
+                        logger.error(f"消息重试 {attempts} 次仍发送失败，放弃发送：{error}")
+                    else:
+                        conn.execute("UPDATE outbox SET attempts = ?, next_at = ?, last_error = ? WHERE hash = ?",
+                                     (attempts, time.time() + self.__delay(attempts + 1), error, row["hash"]))
@@ -1,10 +1,17 @@
+import asyncio
+import heapq
+import importlib
 import json
+import time
 import re
 import warnings
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from multiprocessing.dummy import Pool as ThreadPool
 from threading import Lock
 from typing import Optional, Any, List, Dict, Tuple
+from urllib.parse import urljoin
 
 import pytz
 import requests
@@ -17,7 +24,6 @@ from app.core.config import settings
 from app.core.event import Event, eventmanager
 from app.db.models import PluginData
 from app.db.site_oper import SiteOper
-from app.helper.browser import PlaywrightHelper
 from app.helper.module import ModuleHelper
 from app.helper.sites import SitesHelper
 from app.log import logger
@@ -29,6 +35,11 @@ from app.utils.object import ObjectUtils
 from app.utils.string import StringUtils
 from app.utils.timer import TimerUtils
 
+from .asyncfetch import AsyncSiteFetcher
+from .datastore import SiteDailyDataStore
+from .renderpool import RenderPool
+from .sessionpool import ConditionalAdapterMixin, SiteSessionPool
+
 warnings.filterwarnings("ignore", category=FutureWarning)
 
 lock = Lock()
@@ -42,7 +53,7 @@ class SiteDailyStatistic(_PluginBase):
     # 插件图标
     plugin_icon = "Collabora_A.png"
     # 插件版本
-    plugin_version = "3.4"
+    plugin_version = "3.19"
     # 插件作者
     plugin_author = "Xiang"
     # 作者主页
@@ -61,6 +72,14 @@ class SiteDailyStatistic(_PluginBase):
     _last_update_time: Optional[datetime] = None
     _sites_data: dict = {}
     _site_schema: List[ISiteUserInfo] = None
+    _store: Optional[SiteDailyDataStore] = None
+    # 站点会话池，跨多次刷新复用连接
+    _session_pool: Optional[SiteSessionPool] = None
+    # 站点类型识别缓存，{域名: 站点类型模块.类名}
+    _schema_cache: Dict[str, str] = {}
+    _schema_lock = Lock()
+    # 站点类型模块包
+    _schema_package = 'app.plugins.sitestatistic.siteuserinfo'
 
     # 配置属性
     _enabled: bool = False
@@ -73,6 +92,19 @@ class SiteDailyStatistic(_PluginBase):
     _statistic_type: str = None
     _statistic_sites: list = []
     _dashboard_type: str = "today"
+    _notify_top: int = 0
+    _notify_min_size: int = 0
+    # 刷新模式：thread 多线程，async 异步
+    _fetch_mode: str = "thread"
+    # 异步模式下的最大连接数
+    _async_limit: int = 100
+    # 异步抓取引擎，所有站点的首页及子页面请求共享其连接池
+    _fetcher: Optional[AsyncSiteFetcher] = None
+    # 仿真站点同时渲染数量
+    _render_cnt: int = 2
+    _render_pool: Optional[RenderPool] = None
+    # 上次刷新的站点数据，用于判断做种列表是否需要重新抓取
+    _last_sites_data: Dict[str, dict] = {}
 
     def init_plugin(self, config: dict = None):
         self.sites = SitesHelper()
@@ -92,6 +124,10 @@ class SiteDailyStatistic(_PluginBase):
             self._statistic_type = config.get("statistic_type") or "all"
             self._statistic_sites = config.get("statistic_sites") or []
             self._dashboard_type = config.get("dashboard_type") or "today"
+            self._notify_top = int(config.get("notify_top") or 0)
+            self._notify_min_size = int(config.get("notify_min_size") or 0)
+            self._fetch_mode = config.get("fetch_mode") or "thread"
+            self._render_cnt = int(config.get("render_cnt") or 2)
 
             # 过滤掉已删除的站点
             all_sites = [site.id for site in self.siteoper.list_order_by_pri()] + [site.get("id") for site in
@@ -100,11 +136,20 @@ class SiteDailyStatistic(_PluginBase):
             self.__update_config()
 
         if self._enabled or self._onlyonce:
-            # 加载模块
-            self._site_schema = ModuleHelper.load('app.plugins.sitestatistic.siteuserinfo',
-                                                  filter_func=lambda _, obj: hasattr(obj, 'schema'))
-
-            self._site_schema.sort(key=lambda x: x.order)
+            # 每日数据存储
+            self.__open_store()
+            # 异步模式下启动抓取引擎，站点会话的请求经其共享连接池发送
+            if self._fetch_mode == "async":
+                self._fetcher = AsyncSiteFetcher(limit=self._async_limit)
+                self._fetcher.start()
+            # 站点会话池
+            self._session_pool = SiteSessionPool(fetcher=self._fetcher)
+            # 仿真渲染池
+            self._render_pool = RenderPool(size=self._render_cnt)
+            # 站点类型模块在首次需要时加载
+            self._site_schema = None
+            # 站点类型识别缓存
+            self._schema_cache = self.get_data("schema_cache") or {}
             # 站点上一次更新时间
             self._last_update_time = None
             # 站点数据
@@ -165,6 +210,12 @@ class SiteDailyStatistic(_PluginBase):
             "methods": ["GET"],
             "summary": "刷新每日站点数据",
             "description": "刷新对应域名的站点每日数据",
+        }, {
+            "path": "/transfer_stats_daily",
+            "endpoint": self.transfer_stats,
+            "methods": ["GET"],
+            "summary": "站点刷新传输统计",
+            "description": "最近每次刷新站点数据的请求数、传输字节数及未变化页面数",
         }]
 
     def get_service(self) -> List[Dict[str, Any]]:
@@ -383,6 +434,65 @@ class SiteDailyStatistic(_PluginBase):
                             }
                         ]
                     },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'notify_top',
+                                            'label': '通知站点数量',
+                                            'placeholder': '按上传量列出前N个站点，0为全部'
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'notify_min_size',
+                                            'label': '通知最小数据量（MB）',
+                                            'placeholder': '上传和下载量均小于该值的站点合并到其他站点'
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VSelect',
+                                        'props': {
+                                            'model': 'fetch_mode',
+                                            'label': '刷新模式',
+                                            'items': [
+                                                {'title': '多线程', 'value': 'thread'},
+                                                {'title': '异步', 'value': 'async'}
+                                            ]
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
                     {
                         'component': 'VRow',
                         'content': [
@@ -418,6 +528,23 @@ class SiteDailyStatistic(_PluginBase):
                                     }
                                 ]
                             },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'render_cnt',
+                                            'label': '仿真站点并发数量',
+                                            'placeholder': '2'
+                                        }
+                                    }
+                                ]
+                            },
                         ]
                     }
                 ]
@@ -432,33 +559,29 @@ class SiteDailyStatistic(_PluginBase):
             "remove_failed": False,
             "statistic_type": "all",
             "statistic_sites": [],
-            "dashboard_type": 'today'
+            "dashboard_type": 'today',
+            "notify_top": 0,
+            "notify_min_size": 0,
+            "fetch_mode": "thread",
+            "render_cnt": 2
         }
 
     def __get_data(self) -> Tuple[str, dict, dict]:
         """
         获取今天的日期、今天的站点数据、昨天的站点数据
         """
-        # 最近一天的签到数据
-        stattistic_data: Dict[str, Dict[str, Any]] = {}
-        # 昨天数据
-        yesterday_sites_data: Dict[str, Dict[str, Any]] = {}
-        # 获取最近所有数据
-        data_list: List[PluginData] = self.get_data(key=None)
-        if not data_list:
+        # 插件未启用时仅在查看数据时打开存储
+        self.__open_store()
+        # 最近两天有数据的日期
+        days = self._store.latest_days(2)
+        if not days:
             return "", {}, {}
-        # 取key符合日期格式的数据
-        data_list = [data for data in data_list if re.match(r"\d{4}-\d{2}-\d{2}", data.key)]
-        # 按日期倒序排序
-        data_list.sort(key=lambda x: x.key, reverse=True)
         # 今天的日期
-        today = data_list[0].key
-        # 数据按时间降序排序
-        datas = [json.loads(data.value) for data in data_list if ObjectUtils.is_obj(data.value)]
-        if len(data_list) > 0:
-            stattistic_data = datas[0]
-        if len(data_list) > 1:
-            yesterday_sites_data = datas[1]
+        today = days[0]
+        # 最近一天的数据
+        stattistic_data = self._store.get_day(today)
+        # 昨天数据
+        yesterday_sites_data = self._store.get_day(days[1]) if len(days) > 1 else {}
 
         # 数据按时间降序排序
         stattistic_data = dict(sorted(stattistic_data.items(),
@@ -466,6 +589,39 @@ class SiteDailyStatistic(_PluginBase):
                                       reverse=True))
         return today, stattistic_data, yesterday_sites_data
 
+    def __open_store(self):
+        """
+        打开每日数据存储，首次打开时迁移旧版数据
+        """
+        if self._store:
+            return
+        self._store = SiteDailyDataStore(self.get_data_path() / "daily.db")
+        self.__migrate_data()
+
+    def __migrate_data(self):
+        """
+        将旧版按天保存的插件数据迁移到每日数据存储，仅在存储为空时执行一次
+        """
+        if not self._store.is_empty():
+            return
+        # 取key符合日期格式的数据
+        data_list: List[PluginData] = [data for data in self.get_data(key=None) or []
+                                       if re.match(r"\d{4}-\d{2}-\d{2}", data.key)]
+        if not data_list:
+            return
+
+        def __days():
+            for data in data_list:
+                try:
+                    value = json.loads(data.value) if ObjectUtils.is_obj(data.value) else data.value
+                except ValueError:
+                    continue
+                if isinstance(value, dict):
+                    yield data.key, value
+
+        count = self._store.import_days(__days())
+        logger.info(f"已迁移 {count} 天的站点数据到每日数据存储")
+
     @staticmethod
     def __get_total_elements(today: str, stattistic_data: dict, yesterday_sites_data: dict,
                              dashboard: str = "today") -> List[dict]:
@@ -1130,11 +1286,70 @@ class SiteDailyStatistic(_PluginBase):
                 if self._scheduler.running:
                     self._scheduler.shutdown()
                 self._scheduler = None
+            if self._session_pool:
+                self._session_pool.clear()
+                self._session_pool = None
+            if self._fetcher:
+                self._fetcher.stop()
+                self._fetcher = None
+            if self._render_pool:
+                self._render_pool.stop()
+                self._render_pool = None
         except Exception as e:
             logger.error("退出插件失败：%s" % str(e))
 
-    def __build_class(self, html_text: str) -> Any:
-        for site_schema in self._site_schema:
+    @staticmethod
+    def __schema_key(site_schema: Any) -> str:
+        """
+        站点类型缓存键：模块.类名
+        """
+        return f"{site_schema.__module__}.{site_schema.__name__}"
+
+    def __get_site_schemas(self) -> List[Any]:
+        """
+        加载全部站点类型模块，按顺序排列，仅在需要完整识别时加载一次
+        """
+        with self._schema_lock:
+            if self._site_schema is None:
+                start_time = time.perf_counter()
+                site_schema = ModuleHelper.load(self._schema_package,
+                                                filter_func=lambda _, obj: hasattr(obj, 'schema'))
+                site_schema.sort(key=lambda x: x.order)
+                self._site_schema = site_schema
+                logger.info(f"加载 {len(site_schema)} 个站点类型模块，"
+                            f"耗时 {(time.perf_counter() - start_time) * 1000:.1f} 毫秒")
+            return self._site_schema
+
+    def __load_schema(self, schema_key: str) -> Any:
+        """
+        按缓存键加载单个站点类型
+        """
+        if self._site_schema:
+            for site_schema in self._site_schema:
+                if self.__schema_key(site_schema) == schema_key:
+                    return site_schema
+        module_name, _, class_name = schema_key.rpartition(".")
+        if not module_name.startswith(self._schema_package):
+            return None
+        try:
+            start_time = time.perf_counter()
+            site_schema = getattr(importlib.import_module(module_name), class_name, None)
+            logger.debug(f"加载站点类型模块 {module_name}，耗时 {(time.perf_counter() - start_time) * 1000:.1f} 毫秒")
+            return site_schema if hasattr(site_schema, 'schema') else None
+        except Exception as e:
+            logger.warn(f"加载站点类型模块 {module_name} 失败：{str(e)}")
+            return None
+
+    def __build_class(self, html_text: str, domain: str = None) -> Any:
+        """
+        识别站点类型，优先使用该站点已缓存的类型
+        """
+        cached = self._schema_cache.get(domain) if domain else None
+        if cached:
+            site_schema = self.__load_schema(cached)
+            if site_schema:
+                return site_schema
+        for site_schema in self.__get_site_schemas():
             try:
                 if site_schema.match(html_text):
                     return site_schema
@@ -1142,9 +1357,13 @@ class SiteDailyStatistic(_PluginBase):
                 logger.error(f"站点匹配失败 {str(e)}")
         return None
 
-    def build(self, site_info: CommentedMap) -> Optional[ISiteUserInfo]:
+    def build(self, site_info: CommentedMap, index_html: str = None,
+              session: Optional[requests.Session] = None) -> Optional[ISiteUserInfo]:
         """
         构建站点信息
+        :param site_info: 站点信息
+        :param index_html: 已获取的首页内容，为空时重新获取
+        :param session: 调用方持有的站点会话，为空时从会话池获取
         """
         site_name = site_info.get("name")
         site_cookie = site_info.get("cookie")
@@ -1155,18 +1374,23 @@ class SiteDailyStatistic(_PluginBase):
         url = site_info.get("url")
         proxy = site_info.get("proxy")
         ua = site_info.get("ua")
-        # 会话管理
-        with requests.Session() as session:
+        # 会话管理，复用该站点上次刷新的会话
+        lease = nullcontext(session) if session else self._session_pool.session(url, cookie=site_cookie,
+                                                                                 ua=ua, proxy=proxy)
+        with lease as session:
             proxies = settings.PROXY if proxy else None
             proxy_server = settings.PROXY_SERVER if proxy else None
             render = site_info.get("render")
             logger.debug(f"站点 {site_name} url={url}，site_cookie={site_cookie}，ua={ua}，api_key={apikey}，token={token}，proxy={proxy}")
-            if render:
+            if index_html:
+                # 首页已获取
+                html_text = index_html
+            elif render:
                 # 演染模式
-                html_text = PlaywrightHelper().get_page_source(url=url,
-                                                               cookies=site_cookie,
-                                                               ua=ua,
-                                                               proxies=proxy_server)
+                html_text = self._render_pool.get_page_source(url=url,
+                                                              cookies=site_cookie,
+                                                              ua=ua,
+                                                              proxies=proxy_server)
             else:
                 # 普通模式
                 res = RequestUtils(cookies=site_cookie,
@@ -1235,7 +1459,7 @@ class SiteDailyStatistic(_PluginBase):
                     return None
             # 解析站点类型
             if html_text:
-                site_schema = self.__build_class(html_text)
+                site_schema = self.__build_class(html_text, domain=StringUtils.get_url_domain(url))
                 if not site_schema:
                     logger.error(f"站点 {site_name} 无法识别站点类型，可能是由于插件代码不全，请尝试强制重装插件以确保代码完整")
                     return None
@@ -1275,10 +1499,34 @@ class SiteDailyStatistic(_PluginBase):
             message=f"站点 {domain} 不存在"
         )
 
-    def __refresh_site_data(self, site_info: CommentedMap) -> Optional[ISiteUserInfo]:
+    def transfer_stats(self, apikey: str) -> schemas.Response:
+        """
+        最近刷新的传输统计，可由API调用
+        """
+        if apikey != settings.API_TOKEN:
+            return schemas.Response(success=False, message="API密钥错误")
+        return schemas.Response(success=True, data=self.get_data("transfer_stats") or [])
+
+    def __save_transfer_stats(self, start_time: datetime, site_count: int):
+        """
+        记录本次刷新的传输统计，保留最近30次
+        """
+        stats = self._session_pool.stats.reset()
+        logger.info(f"本次刷新 {site_count} 个站点，共 {stats['requests']} 个请求，"
+                    f"传输 {StringUtils.str_filesize(stats['bytes'])}，{stats['not_modified']} 个页面未变化")
+        history = self.get_data("transfer_stats") or []
+        history.append({
+            "time": start_time.strftime('%Y-%m-%d %H:%M:%S'),
+            "sites": site_count,
+            **stats
+        })
+        self.save_data("transfer_stats", history[-30:])
+
+    def __refresh_site_data(self, site_info: CommentedMap, index_html: str = None) -> Optional[ISiteUserInfo]:
         """
         更新单个site 数据信息
         :param site_info:
+        :param index_html: 异步模式下已获取的首页内容
         :return:
         """
         site_name = site_info.get('name')
@@ -1287,13 +1535,16 @@ class SiteDailyStatistic(_PluginBase):
             return None
         unread_msg_notify = True
         try:
-            site_user_info: ISiteUserInfo = self.build(site_info=site_info)
+            # 首页及解析时的用户详情、做种列表请求共用同一会话，任一环节出错时移除该会话
+            with self._session_pool.session(site_url, cookie=site_info.get("cookie"), ua=site_info.get("ua"),
+                                            proxy=site_info.get("proxy")) as session:
+                site_user_info: ISiteUserInfo = self.build(site_info=site_info, index_html=index_html, session=session)
+                if site_user_info:
+                    site_user_info = self.__parse_site(site_info=site_info, site_user_info=site_user_info,
+                                                       session=session)
+                if site_user_info and site_user_info.err_msg:
+                    self._session_pool.evict(site_url)
             if site_user_info:
-                logger.debug(f"站点 {site_name} 开始以 {site_user_info.site_schema()} 模型解析")
-                # 开始解析
-                site_user_info.parse()
-                logger.debug(f"站点 {site_name} 解析完成")
-
                 # 获取不到数据时，仅返回错误信息，不做历史数据更新
                 if site_user_info.err_msg:
                     if site_name in self._sites_data:
@@ -1339,6 +1590,118 @@ class SiteDailyStatistic(_PluginBase):
             logger.error(traceback.format_exc())
         return None
 
+    def __async_refresh_sites(self, refresh_sites: List[CommentedMap]):
+        """
+        异步刷新站点：首页在抓取引擎的事件循环中并发获取，不占用线程；站点解析在有限的线程中执行，
+        解析时的用户详情、做种列表等子页面请求经站点会话提交到同一共享连接池
+        """
+        with ThreadPoolExecutor(max_workers=int(self._queue_cnt or 5),
+                                thread_name_prefix="SiteDailyStatistic") as executor:
+
+            async def __refresh(site_info: CommentedMap):
+                site_name = site_info.get("name")
+                if not site_info.get("url") or not (site_info.get("cookie") or site_info.get("apikey")
+                                                    or site_info.get("token")):
+                    return
+                index_html = None
+                if not site_info.get("render"):
+                    try:
+                        index_html = await self._fetcher.fetch_index(site_info)
+                    except Exception as e:
+                        logger.error(f"站点 {site_name} 获取首页失败：{str(e)}")
+                    if not index_html:
+                        return
+                # 仿真模式站点的首页在解析线程中获取
+                await asyncio.get_running_loop().run_in_executor(executor, self.__refresh_site_data,
+                                                                 site_info, index_html)
+
+            async def __refresh_all():
+                await asyncio.gather(*[__refresh(site_info) for site_info in refresh_sites])
+
+            self._fetcher.run(__refresh_all()).result()
+
+    def __parse_site(self, site_info: CommentedMap, site_user_info: ISiteUserInfo,
+                     session: Optional[requests.Session] = None) -> Optional[ISiteUserInfo]:
+        """
+        解析站点数据，以缓存的站点类型解析失败时重新识别站点类型
+        """
+        site_name = site_info.get('name')
+        domain = StringUtils.get_url_domain(site_info.get('url'))
+        schema_name = self.__schema_key(type(site_user_info))
+        cached = self._schema_cache.get(domain) == schema_name
+        logger.debug(f"站点 {site_name} 开始以 {site_user_info.site_schema()} 模型解析")
+        try:
+            self.__reuse_unchanged_seeding(site_info, site_user_info, session)
+            site_user_info.parse()
+        except Exception as e:
+            if not cached:
+                raise e
+            site_user_info.err_msg = str(e)
+        if cached and site_user_info.err_msg:
+            # 清除缓存后完整识别，类型不变时沿用本次解析结果
+            self.__update_schema_cache(domain, None)
+            new_site_user_info = self.build(site_info=site_info,
+                                            index_html=getattr(site_user_info, "_index_html", None),
+                                            session=session)
+            if new_site_user_info and self.__schema_key(type(new_site_user_info)) != schema_name:
+                logger.info(f"站点 {site_name} 以缓存的站点类型解析失败，重新识别为 {new_site_user_info.site_schema()}")
+                site_user_info = new_site_user_info
+                self.__reuse_unchanged_seeding(site_info, site_user_info, session)
+                site_user_info.parse()
+        logger.debug(f"站点 {site_name} 解析完成")
+        if not site_user_info.err_msg:
+            self.__update_schema_cache(domain, self.__schema_key(type(site_user_info)))
+        return site_user_info
+
+    def __reuse_unchanged_seeding(self, site_info: CommentedMap, site_user_info: ISiteUserInfo,
+                                  session: Optional[requests.Session]):
+        """
+        做种列表页由站点会话的适配器缓存；抓取做种列表时，做种数已从首页或用户详情页解析得到且与上次数据一致，
+        适配器直接返回上次抓取的做种列表页，解析得到的做种体积及做种明细与上次一致，不再请求站点
+        """
+        site_url = site_info.get("url")
+        if not session or not site_url:
+            return
+        adapter = session.get_adapter(site_url)
+        if not isinstance(adapter, ConditionalAdapterMixin):
+            return
+        last_data = self._last_sites_data.get(site_info.get("name")) or {}
+        # 请求第一页做种列表时判断，部分站点的做种数在逐页抓取时累加，不能在抓取中途重新判断
+        decision = {}
+
+        def __is_seeding_page(url: str) -> bool:
+            # 做种列表地址在解析用户信息后才确定，请求时再判断
+            seeding_page = getattr(site_user_info, "_torrent_seeding_page", None)
+            return bool(seeding_page) and url.startswith(urljoin(site_url, seeding_page.split("?")[0]))
+
+        def __is_unchanged(url: str) -> bool:
+            if not __is_seeding_page(url):
+                return False
+            if "reuse" not in decision:
+                decision["reuse"] = bool(last_data.get("seeding") and site_user_info.seeding
+                                         and int(site_user_info.seeding) == int(last_data.get("seeding")))
+                if decision["reuse"]:
+                    logger.debug(f"站点 {site_info.get('name')} 做种数未变化，使用上次抓取的做种列表")
+            return decision["reuse"]
+
+        adapter.set_reuse(keep=__is_seeding_page, reuse=__is_unchanged)
+
+    def __update_schema_cache(self, domain: str, schema_name: Optional[str]):
+        """
+        更新站点类型识别缓存，有变化时保存
+        """
+        if not domain:
+            return
+        with self._schema_lock:
+            if self._schema_cache.get(domain) == schema_name:
+                return
+            if schema_name:
+                self._schema_cache[domain] = schema_name
+            else:
+                self._schema_cache.pop(domain, None)
+            schema_cache = dict(self._schema_cache)
+        self.save_data("schema_cache", schema_cache)
+
     def __notify_unread_msg(self, site_name: str, site_user_info: ISiteUserInfo, unread_msg_notify: bool):
         if site_user_info.message_unread <= 0:
             return
@@ -1406,27 +1769,38 @@ class SiteDailyStatistic(_PluginBase):
             
             if self._statistic_type == "add" or not self._remove_failed:
                 if last_update_time := self.get_data("last_update_time"):
-                    yesterday_sites_data = self.get_data(last_update_time) or {}
+                    yesterday_sites_data = self._store.get_day(last_update_time)
 
             # 将数据初始化为上次更新的数据，筛选站点
-            old_sites_data = self.get_data(today_date) or {}
+            old_sites_data = self._store.get_day(today_date)
+            if old_sites_data:
+                self._last_sites_data = old_sites_data
+            else:
+                last_days = self._store.latest_days(1)
+                self._last_sites_data = self._store.get_day(last_days[0]) if last_days else {}
             if not self._remove_failed and old_sites_data:
                 site_names = [site.get("name") for site in refresh_sites]
                 self._sites_data = {k: v for k, v in old_sites_data.items() if k in site_names}
 
             # 并发刷新
-            with ThreadPool(min(len(refresh_sites), int(self._queue_cnt or 5))) as p:
-                p.map(self.__refresh_site_data, refresh_sites)
+            self._session_pool.stats.reset()
+            if self._fetcher:
+                self.__async_refresh_sites(refresh_sites)
+            else:
+                with ThreadPool(min(len(refresh_sites), int(self._queue_cnt or 5))) as p:
+                    p.map(self.__refresh_site_data, refresh_sites)
+            self.__save_transfer_stats(now, len(refresh_sites))
 
             # 通知刷新完成
             if self._notify:
-                messages = {}
+                # 站点数据：(站点标题, 上传量, 下载量)
+                sites = []
                 # 总上传
                 incUploads = 0
                 # 总下载
                 incDownloads = 0
 
-                for rand, site in enumerate(self._sites_data.keys()):
+                for site in self._sites_data.keys():
                     upload = int(self._sites_data[site].get("upload") or 0)
                     download = int(self._sites_data[site].get("download") or 0)
                     updated_date = self._sites_data[site].get("updated_at")
@@ -1443,15 +1817,10 @@ class SiteDailyStatistic(_PluginBase):
                     if upload > 0 or download > 0:
                         incUploads += upload
                         incDownloads += download
-                        messages[upload + (rand / 1000)] = (
-                                f"【{site}】{updated_date}\n"
-                                + f"上传量：{StringUtils.str_filesize(upload)}\n"
-                                + f"下载量：{StringUtils.str_filesize(download)}\n"
-                                + "————————————"
-                        )
+                        sites.append((f"【{site}】{updated_date}", upload, download))
 
                 if incDownloads or incUploads:
-                    sorted_messages = [messages[key] for key in sorted(messages.keys(), reverse=True)]
+                    sorted_messages = self.__digest_messages(sites)
                     sorted_messages.insert(0, f"【汇总】\n"
                                               f"总上传：{StringUtils.str_filesize(incUploads)}\n"
                                               f"总下载：{StringUtils.str_filesize(incDownloads)}\n"
@@ -1460,7 +1829,7 @@ class SiteDailyStatistic(_PluginBase):
                                       title="站点数据统计", text="\n".join(sorted_messages))
 
             # 保存数据
-            self.save_data(today_date, self._sites_data)
+            self._store.save_day(today_date, self._sites_data)
 
             # 更新时间
             if last_update_time:
@@ -1478,6 +1847,34 @@ class SiteDailyStatistic(_PluginBase):
             
             logger.info("站点数据刷新完成")
 
+    def __digest_messages(self, sites: List[Tuple[str, int, int]]) -> List[str]:
+        """
+        生成站点消息，按上传量列出前N个且数据量达到阈值的站点，其余站点合并为一条
+        :param sites: 站点列表，(站点标题, 上传量, 下载量)
+        """
+        min_size = self._notify_min_size * 1024 * 1024
+        candidates = [site for site in sites if max(site[1], site[2]) >= min_size] if min_size else sites
+        if self._notify_top:
+            top_sites = heapq.nlargest(self._notify_top, candidates, key=lambda x: x[1])
+        else:
+            top_sites = sorted(candidates, key=lambda x: x[1], reverse=True)
+        messages = [
+            f"{title}\n"
+            f"上传量：{StringUtils.str_filesize(upload)}\n"
+            f"下载量：{StringUtils.str_filesize(download)}\n"
+            f"————————————"
+            for title, upload, download in top_sites
+        ]
+        others = len(sites) - len(top_sites)
+        if others > 0:
+            other_upload = sum(site[1] for site in sites) - sum(site[1] for site in top_sites)
+            other_download = sum(site[2] for site in sites) - sum(site[2] for site in top_sites)
+            messages.append(f"【其他 {others} 个站点】\n"
+                            f"上传量：{StringUtils.str_filesize(other_upload)}\n"
+                            f"下载量：{StringUtils.str_filesize(other_download)}\n"
+                            f"————————————")
+        return messages
+
     def __custom_sites(self) -> List[Any]:
         custom_sites = []
         custom_sites_config = self.get_config("CustomSites")
@@ -1496,7 +1893,11 @@ class SiteDailyStatistic(_PluginBase):
             "remove_failed": self._remove_failed,
             "statistic_type": self._statistic_type,
             "statistic_sites": self._statistic_sites,
-            "dashboard_type": self._dashboard_type
+            "dashboard_type": self._dashboard_type,
+            "notify_top": self._notify_top,
+            "notify_min_size": self._notify_min_size,
+            "fetch_mode": self._fetch_mode,
+            "render_cnt": self._render_cnt
         })
 
     @eventmanager.register(EventType.SiteDeleted)
@@ -0,0 +1,280 @@
+import asyncio
+import re
+import threading
+from collections import namedtuple
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from http.client import HTTPMessage
+from types import SimpleNamespace
+from typing import Coroutine, List, Optional, Tuple
+
+import aiohttp
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.cookies import extract_cookies_to_jar
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers, select_proxy
+
+from app.core.config import settings
+from app.log import logger
+
+from .sessionpool import ConditionalAdapterMixin, TransferStats
+
+# 响应：状态码、原因、响应头列表、内容、最终URL、传输字节数
+FetchResult = namedtuple("FetchResult", ["status", "reason", "headers", "body", "url", "size"])
+
+
+class AsyncSiteFetcher:
+    """
+    基于asyncio的站点抓取引擎：在独立线程中运行事件循环，所有站点共享一个aiohttp连接池，按站点限制连接数并保持长连接
+    首页在事件循环中并发获取；站点解析仍为同步代码，解析时的用户详情、做种列表等子页面请求经 adapter() 提交到同一连接池
+    """
+
+    def __init__(self, limit: int = 100, limit_per_host: int = 2, timeout: int = 60):
+        """
+        :param limit: 连接池总连接数
+        :param limit_per_host: 每个站点的最大连接数
+        :param timeout: 请求超时时间（秒）
+        """
+        self._limit = limit
+        self._limit_per_host = limit_per_host
+        self._timeout = timeout
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        # 所有请求的传输统计
+        self.stats = TransferStats()
+
+    def start(self):
+        """
+        启动事件循环线程并创建连接池
+        """
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="SiteDailyStatistic-fetcher",
+                                        daemon=True)
+        self._thread.start()
+        self.run(self.__open()).result(timeout=10)
+
+    def stop(self, timeout: int = 5):
+        """
+        关闭连接池并停止事件循环
+        """
+        if not self._loop or self._loop.is_closed():
+            return
+        try:
+            self.run(self.__close()).result(timeout=timeout)
+        except Exception as e:
+            logger.warn(f"关闭站点抓取连接池失败：{str(e)}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=timeout)
+        if not self._thread.is_alive():
+            self._loop.close()
+        self._thread = None
+
+    async def __open(self):
+        connector = aiohttp.TCPConnector(limit=self._limit,
+                                         limit_per_host=self._limit_per_host,
+                                         keepalive_timeout=60)
+        # 站点cookie由请求头携带，共享连接池不保存cookie，避免站点之间串用
+        self._session = aiohttp.ClientSession(connector=connector,
+                                              cookie_jar=aiohttp.DummyCookieJar(),
+                                              timeout=aiohttp.ClientTimeout(total=self._timeout))
+
+    async def __close(self):
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+    def run(self, coro: Coroutine):
+        """
+        在事件循环中执行协程，可在任意线程调用，返回 concurrent.futures.Future
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def adapter(self) -> "ConditionalAsyncAdapter":
+        """
+        经本连接池发送请求的requests传输适配器，带条件请求缓存
+        """
+        return ConditionalAsyncAdapter(stats=self.stats, fetcher=self)
+
+    async def request(self, method: str, url: str, headers: dict = None, data: bytes = None, proxy: str = None,
+                      timeout: float = None, verify: bool = True, allow_redirects: bool = False) -> FetchResult:
+        """
+        发送请求并读取完整响应
+        """
+        async with self._session.request(method, url, headers=headers, data=data, proxy=proxy,
+                                         ssl=None if verify else False,
+                                         allow_redirects=allow_redirects,
+                                         timeout=aiohttp.ClientTimeout(total=timeout or self._timeout)) as res:
+            body = await res.read()
+            return FetchResult(status=res.status,
+                               reason=res.reason,
+                               headers=list(res.headers.items()),
+                               body=body,
+                               url=str(res.url),
+                               # 有Content-Length时为压缩后的大小
+                               size=res.content_length or len(body))
+
+    def fetch(self, method: str, url: str, **kwargs) -> FetchResult:
+        """
+        同步发送请求，在解析线程中调用，等待事件循环完成请求
+        """
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("不能在抓取引擎的事件循环线程中同步请求")
+        timeout = kwargs.get("timeout") or self._timeout
+        future = self.run(self.request(method, url, **kwargs))
+        try:
+            return future.result(timeout=timeout + 5)
+        except FutureTimeoutError:
+            future.cancel()
+            raise
+
+    async def _get(self, url: str, cookie: str = None, ua: str = None,
+                   proxy: str = None) -> Tuple[Optional[int], Optional[str]]:
+        """
+        GET请求，返回状态码和按页面编码解码后的文本
+        """
+        headers = {"User-Agent": ua or settings.USER_AGENT}
+        if cookie:
+            headers["Cookie"] = cookie
+        try:
+            result = await self.request("GET", url, headers=headers, proxy=proxy, verify=False, allow_redirects=True)
+        except Exception as e:
+            logger.debug(f"请求 {url} 失败：{str(e)}")
+            return None, None
+        self.stats.add(result.size)
+        if re.search(rb"charset=\"?utf-8\"?", result.body, re.IGNORECASE):
+            encoding = "utf-8"
+        else:
+            encoding = get_encoding_from_headers(CaseInsensitiveDict(result.headers)) or "utf-8"
+        try:
+            return result.status, result.body.decode(encoding, errors="replace")
+        except LookupError:
+            return result.status, result.body.decode("utf-8", errors="replace")
+
+    async def fetch_index(self, site_info: dict) -> Optional[str]:
+        """
+        获取站点首页，处理首次登录反爬和假首页，逻辑与同步模式一致
+        """
+        site_name = site_info.get("name")
+        url = site_info.get("url")
+        cookie = site_info.get("cookie")
+        ua = site_info.get("ua")
+        proxy = settings.PROXY_HOST if site_info.get("proxy") else None
+
+        status, html_text = await self._get(url, cookie=cookie, ua=ua, proxy=proxy)
+        if status is None:
+            logger.error(f"站点 {site_name} 无法访问：{url}")
+            return None
+        if status != 200:
+            logger.error(f"站点 {site_name} 连接失败，状态码：{status}")
+            return None
+        # 第一次登录反爬
+        if html_text.find("title") == -1:
+            i = html_text.find("window.location")
+            if i == -1:
+                return None
+            tmp_url = url + html_text[i:html_text.find(";")] \
+                .replace("\"", "") \
+                .replace("+", "") \
+                .replace(" ", "") \
+                .replace("window.location=", "")
+            status, html_text = await self._get(tmp_url, cookie=cookie, ua=ua, proxy=proxy)
+            if status is None:
+                logger.error("站点 %s 无法访问：%s" % (site_name, url))
+                return None
+            if status != 200:
+                logger.error("站点 %s 被反爬限制：%s, 状态码：%s" % (site_name, url, status))
+                return None
+            if not html_text:
+                return None
+        # 兼容假首页情况，假首页通常没有 <link rel="search" 属性
+        if '"search"' not in html_text and '"csrf-token"' not in html_text:
+            # 排除掉单页面应用，单页面应用首页包含一个 div 容器
+            if not re.search(r"id=\"?root\"?", html_text, re.IGNORECASE):
+                status, index_text = await self._get(url + "/index.php", cookie=cookie, ua=ua, proxy=proxy)
+                if status == 200:
+                    if not index_text:
+                        return None
+                    html_text = index_text
+        return html_text
+
+
+class _RawResponse:
+    """
+    代替urllib3响应，提供requests提取cookie及统计传输量所需的接口
+    """
+
+    def __init__(self, headers: List[Tuple[str, str]], size: int):
+        msg = HTTPMessage()
+        for name, value in headers:
+            msg[name] = value
+        self._original_response = SimpleNamespace(msg=msg)
+        self._size = size
+
+    def tell(self) -> int:
+        return self._size
+
+    def release_conn(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class AsyncFetchAdapter(BaseAdapter):
+    """
+    requests传输适配器：请求提交到异步抓取引擎的共享连接池发送，站点解析代码无需修改；
+    重定向及cookie仍由requests会话处理，aiohttp不支持的代理（如socks）回退到requests连接池
+    """
+
+    def __init__(self, fetcher: AsyncSiteFetcher):
+        super().__init__()
+        self._fetcher = fetcher
+        self._fallback: Optional[HTTPAdapter] = None
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        proxy = select_proxy(request.url, proxies)
+        if proxy and not proxy.startswith("http"):
+            if not self._fallback:
+                self._fallback = HTTPAdapter()
+            return self._fallback.send(request, stream=stream, timeout=timeout, verify=verify, cert=cert,
+                                       proxies=proxies)
+        if isinstance(timeout, tuple):
+            timeout = sum(t for t in timeout if t) or None
+        headers = {name: value for name, value in request.headers.items() if name.lower() != "content-length"}
+        try:
+            result = self._fetcher.fetch(request.method, request.url, headers=headers, data=request.body,
+                                         proxy=proxy, timeout=timeout, verify=bool(verify))
+        except (asyncio.TimeoutError, FutureTimeoutError) as e:
+            raise requests.exceptions.Timeout(e, request=request)
+        except aiohttp.ClientError as e:
+            raise requests.exceptions.ConnectionError(e, request=request)
+        return self.__build_response(request, result)
+
+    def __build_response(self, request, result: FetchResult) -> requests.Response:
+        response = requests.Response()
+        response.status_code = result.status
+        response.reason = result.reason
+        headers = CaseInsensitiveDict()
+        for name, value in result.headers:
+            headers[name] = f"{headers[name]}, {value}" if name in headers else value
+        response.headers = headers
+        response.encoding = get_encoding_from_headers(headers)
+        response._content = result.body
+        response._content_consumed = True
+        response.raw = _RawResponse(result.headers, result.size)
+        response.url = result.url
+        response.request = request
+        response.connection = self
+        extract_cookies_to_jar(response.cookies, request, response.raw)
+        return response
+
+    def close(self):
+        if self._fallback:
+            self._fallback.close()
+
+
+class ConditionalAsyncAdapter(ConditionalAdapterMixin, AsyncFetchAdapter):
+    """
+    条件请求适配器，经异步抓取引擎的共享连接池发送
+    """
@@ -0,0 +1,118 @@
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+class SiteDailyDataStore:
+    """
+    站点每日数据存储，每个站点每天一行，数值字段按类型存储
+    """
+
+    # 字段名称及类型
+    _columns: List[Tuple[str, str]] = [
+        ("username", "TEXT"),
+        ("user_level", "TEXT"),
+        ("join_at", "TEXT"),
+        ("upload", "INTEGER"),
+        ("download", "INTEGER"),
+        ("ratio", "REAL"),
+        ("bonus", "REAL"),
+        ("seeding", "INTEGER"),
+        ("seeding_size", "INTEGER"),
+        ("leeching", "INTEGER"),
+        ("url", "TEXT"),
+        ("err_msg", "TEXT"),
+        ("message_unread", "INTEGER"),
+        ("updated_at", "TEXT"),
+    ]
+
+    def __init__(self, db_path: Path):
+        self._db_path = str(db_path)
+        self._lock = Lock()
+        with closing(self.__connect()) as conn, conn:
+            columns = ", ".join(f"{name} {col_type}" for name, col_type in self._columns)
+            conn.execute(f"CREATE TABLE IF NOT EXISTS site_daily ("
+                         f"day TEXT NOT NULL, site TEXT NOT NULL, {columns}, "
+                         f"PRIMARY KEY (day, site))")
+
+    def __connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self._db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @staticmethod
+    def __convert(value: Any, col_type: str) -> Any:
+        """
+        按字段类型转换，无法转换时保留为空
+        """
+        if value is None or value == "":
+            return None
+        try:
+            if col_type == "INTEGER":
+                return int(float(value))
+            if col_type == "REAL":
+                return float(value)
+        except (TypeError, ValueError):
+            return None
+        return str(value)
+
+    def __rows(self, day: str, sites_data: Dict[str, dict]) -> List[tuple]:
+        return [
+            (day, site) + tuple(self.__convert(data.get(name), col_type) for name, col_type in self._columns)
+            for site, data in sites_data.items() if isinstance(data, dict)
+        ]
+
+    def save_day(self, day: str, sites_data: Dict[str, dict]):
+        """
+        保存一天的全部站点数据，替换该天原有数据
+        """
+        names = ["day", "site"] + [name for name, _ in self._columns]
+        updates = ", ".join(f"{name}=excluded.{name}" for name, _ in self._columns)
+        with self._lock, closing(self.__connect()) as conn, conn:
+            sites = list(sites_data.keys())
+            conn.execute(f"DELETE FROM site_daily WHERE day = ? AND site NOT IN ({', '.join('?' * len(sites))})",
+                         [day] + sites)
+            conn.executemany(f"INSERT INTO site_daily ({', '.join(names)}) "
+                             f"VALUES ({', '.join('?' * len(names))}) "
+                             f"ON CONFLICT(day, site) DO UPDATE SET {updates}",
+                             self.__rows(day, sites_data))
+
+    def import_days(self, days: Iterable[Tuple[str, Dict[str, dict]]]) -> int:
+        """
+        批量导入多天数据，已存在的天保留原数据，返回导入的天数
+        """
+        names = ["day", "site"] + [name for name, _ in self._columns]
+        count = 0
+        with self._lock, closing(self.__connect()) as conn, conn:
+            for day, sites_data in days:
+                if not sites_data:
+                    continue
+                conn.executemany(f"INSERT OR IGNORE INTO site_daily ({', '.join(names)}) "
+                                 f"VALUES ({', '.join('?' * len(names))})",
+                                 self.__rows(day, sites_data))
+                count += 1
+        return count
+
+    def get_day(self, day: Optional[str]) -> Dict[str, dict]:
+        """
+        读取一天的站点数据，{站点名称: 数据}
+        """
+        if not day:
+            return {}
+        with closing(self.__connect()) as conn:
+            rows = conn.execute("SELECT * FROM site_daily WHERE day = ?", (day,)).fetchall()
+        return {row["site"]: {name: row[name] for name, _ in self._columns} for row in rows}
+
+    def latest_days(self, limit: int = 2) -> List[str]:
+        """
+        最近有数据的日期，按日期倒序
+        """
+        with closing(self.__connect()) as conn:
+            rows = conn.execute("SELECT DISTINCT day FROM site_daily ORDER BY day DESC LIMIT ?", (limit,)).fetchall()
+        return [row["day"] for row in rows]
+
+    def is_empty(self) -> bool:
+        with closing(self.__connect()) as conn:
+            return conn.execute("SELECT 1 FROM site_daily LIMIT 1").fetchone() is None
@@ -0,0 +1,178 @@
+import threading
+import time
+from concurrent.futures import Future
+from queue import Queue, Empty
+from typing import Any, Optional, List
+
+from app.log import logger
+
+
+class RenderPool:
+    """
+    仿真页面渲染池：固定数量的渲染线程各自持有一个常驻浏览器，每个站点使用独立的浏览器上下文注入cookie和UA，
+    页面处理与PlaywrightHelper一致（stealth及cloudflare验证重试），页面超时后回收浏览器，空闲一段时间后渲染线程自动退出
+    playwright及cf_clearance在渲染线程启动时才导入，未安装时插件仍可正常加载，仅仿真站点无法刷新
+    """
+
+    def __init__(self, size: int = 2, timeout: int = 60, idle_timeout: int = 60, max_pages: int = 50,
+                 headless: bool = False):
+        """
+        :param size: 渲染线程数量，即同时渲染的页面数
+        :param timeout: 单个页面超时时间（秒）
+        :param idle_timeout: 渲染线程空闲退出时间（秒）
+        :param max_pages: 每个浏览器渲染页面数达到该值后重启，避免内存增长
+        :param headless: 是否无头模式，与PlaywrightHelper一致默认有头，便于通过cloudflare验证
+        """
+        self._size = max(size, 1)
+        self._timeout = timeout
+        self._idle_timeout = idle_timeout
+        self._max_pages = max_pages
+        self._headless = headless
+        self._queue: Queue = Queue()
+        self._workers: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def get_page_source(self, url: str, cookies: str = None, ua: str = None,
+                        proxies: dict = None) -> Optional[str]:
+        """
+        渲染页面并返回页面源码，参数与PlaywrightHelper.get_page_source一致
+        """
+        if self._stop_event.is_set():
+            return None
+        future = Future()
+        self._queue.put((future, url, cookies, ua, proxies))
+        self.__ensure_workers()
+        try:
+            # 包含排队时间
+            return future.result(timeout=self._timeout * 3)
+        except Exception as e:
+            future.cancel()
+            logger.error(f"仿真获取页面 {url} 失败：{str(e)}")
+            return None
+
+    def stop(self, timeout: float = 10):
+        """
+        停止所有渲染线程，排队中的页面立即返回失败
+        :param timeout: 等待所有渲染线程退出的总时间（秒），超时后不再等待，渲染线程完成当前页面后自行退出
+        """
+        self._stop_event.set()
+        self.__fail_pending()
+        with self._lock:
+            workers = list(self._workers)
+        # 每个渲染线程一个结束标记，唤醒等待中的线程
+        for _ in workers:
+            self._queue.put(None)
+        deadline = time.monotonic() + timeout
+        for worker in workers:
+            worker.join(timeout=max(deadline - time.monotonic(), 0))
+        alive = [worker for worker in workers if worker.is_alive()]
+        if alive:
+            logger.warn(f"仍有 {len(alive)} 个渲染线程未退出，不再等待")
+        self.__fail_pending()
+        self._stop_event.clear()
+
+    def __fail_pending(self, reason: str = "渲染池已停止"):
+        """
+        清空队列，排队中的页面返回失败
+        """
+        while True:
+            try:
+                job = self._queue.get_nowait()
+            except Empty:
+                return
+            if job and job[0].set_running_or_notify_cancel():
+                job[0].set_exception(RuntimeError(reason))
+
+    def __ensure_workers(self):
+        with self._lock:
+            self._workers = [worker for worker in self._workers if worker.is_alive()]
+            while len(self._workers) < self._size:
+                worker = threading.Thread(target=self.__run, name="SiteDailyStatisticRender", daemon=True)
+                self._workers.append(worker)
+                worker.start()
+
+    def __render(self, browser: Any, url: str, cookies: str, ua: str, proxies: dict) -> str:
+        from cf_clearance import sync_cf_retry, sync_stealth
+        from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+
+        context = browser.new_context(user_agent=ua, proxy=proxies)
+        try:
+            page = context.new_page()
+            page.set_default_timeout(self._timeout * 1000)
+            if cookies:
+                page.set_extra_http_headers({"cookie": cookies})
+            # 尝试跳过cloudflare验证
+            sync_stealth(page, pure=True)
+            page.goto(url)
+            if not sync_cf_retry(page)[0]:
+                logger.warn(f"仿真页面 {url} cloudflare验证失败")
+            try:
+                page.wait_for_load_state("networkidle", timeout=self._timeout * 1000)
+            except PlaywrightTimeoutError:
+                pass
+            return page.content()
+        finally:
+            context.close()
+
+    @staticmethod
+    def __close(browser: Any):
+        try:
+            browser.close()
+        except Exception as e:
+            logger.debug(f"关闭浏览器失败：{str(e)}")
+
+    def __run(self):
+        current = threading.current_thread()
+        try:
+            # 依赖缺失时不启动浏览器，排队中的页面直接返回失败
+            import cf_clearance
+            from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
+        except ImportError as e:
+            logger.error(f"仿真渲染依赖未安装：{str(e)}")
+            with self._lock:
+                if current in self._workers:
+                    self._workers.remove(current)
+            self.__fail_pending(reason=f"仿真渲染依赖未安装：{str(e)}")
+            return
+        browser = None
+        pages = 0
+        with sync_playwright() as playwright:
+            try:
+                while not self._stop_event.is_set():
+                    try:
+                        job = self._queue.get(timeout=self._idle_timeout)
+                    except Empty:
+                        with self._lock:
+                            if self._queue.empty():
+                                self._workers.remove(current)
+                                break
+                        continue
+                    if job is None:
+                        # 结束标记
+                        break
+                    future, url, cookies, ua, proxies = job
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    if browser and (pages >= self._max_pages or not browser.is_connected()):
+                        self.__close(browser)
+                        browser = None
+                    if not browser:
+                        browser = playwright.chromium.launch(headless=self._headless)
+                        pages = 0
+                    try:
+                        future.set_result(self.__render(browser, url, cookies, ua, proxies))
+                    except Exception as e:
+                        future.set_exception(e)
+                        if isinstance(e, PlaywrightTimeoutError):
+                            # 页面卡住时回收浏览器
+                            logger.warn(f"仿真页面 {url} 超时，重启浏览器")
+                            self.__close(browser)
+                            browser = None
+                    pages += 1
+            finally:
+                if browser:
+                    self.__close(browser)
+                with self._lock:
+                    if current in self._workers:
+                        self._workers.remove(current)
@@ -0,0 +1,236 @@
+import hashlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from threading import Lock
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.log import logger
+
+
+class TransferStats:
+    """
+    一次刷新的传输统计：请求数、传输字节数、未变化（304）的页面数
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._requests = 0
+        self._bytes = 0
+        self._not_modified = 0
+
+    def add(self, size: int, not_modified: bool = False):
+        with self._lock:
+            self._requests += 1
+            self._bytes += size
+            if not_modified:
+                self._not_modified += 1
+
+    def reset(self) -> Dict[str, int]:
+        """
+        返回当前统计并清零
+        """
+        with self._lock:
+            stats = {
+                "requests": self._requests,
+                "bytes": self._bytes,
+                "not_modified": self._not_modified
+            }
+            self._requests = self._bytes = self._not_modified = 0
+        return stats
+
+
+class ConditionalAdapterMixin:
+    """
+    条件请求：缓存站点返回ETag/Last-Modified的GET页面，再次请求时携带条件头，
+    返回304时以缓存内容作为200响应，同时统计传输字节数；与具体的传输适配器组合使用
+    通过 set_reuse 指定的页面（如做种列表）无论有无ETag均缓存，站点数据未变化时直接以缓存内容响应，不再请求站点
+    """
+
+    def __init__(self, stats: TransferStats, max_entries: int = 32, max_content: int = 2 * 1024 * 1024, **kwargs):
+        super().__init__(**kwargs)
+        self._stats = stats
+        self._max_entries = max_entries
+        self._max_content = max_content
+        self._cache: "OrderedDict[str, Tuple[Optional[str], Optional[str], bytes, Optional[str]]]" = OrderedDict()
+        self._cache_lock = Lock()
+        self._keep: Optional[Callable[[str], bool]] = None
+        self._reuse: Optional[Callable[[str], bool]] = None
+
+    def set_reuse(self, keep: Optional[Callable[[str], bool]] = None, reuse: Optional[Callable[[str], bool]] = None):
+        """
+        设置需要缓存及直接复用的页面，在发送请求时调用判断
+        :param keep: 按URL判断页面是否缓存，不要求站点返回ETag/Last-Modified
+        :param reuse: 按URL判断缓存的页面是否可直接复用
+        """
+        self._keep = keep
+        self._reuse = reuse
+
+    @staticmethod
+    def __key(request) -> str:
+        if request.method == "GET" or not request.body:
+            return request.url
+        body = request.body if isinstance(request.body, bytes) else str(request.body).encode("utf-8")
+        return f"{request.url}#{hashlib.md5(body).hexdigest()}"
+
+    def send(self, request, stream=False, **kwargs):
+        cached = None
+        key = self.__key(request)
+        keep = not stream and request.method in ("GET", "POST") and self._keep and self._keep(request.url)
+        if keep:
+            with self._cache_lock:
+                cached = self._cache.get(key)
+            if cached and self._reuse and self._reuse(request.url):
+                self._stats.add(0, not_modified=True)
+                logger.debug(f"页面数据未变化，直接使用缓存内容：{request.url}")
+                return self.__cached_response(request, cached)
+        if request.method == "GET" and not stream \
+                and "If-None-Match" not in request.headers and "If-Modified-Since" not in request.headers:
+            with self._cache_lock:
+                cached = self._cache.get(key)
+            if cached:
+                etag, last_modified, _, _ = cached
+                if etag:
+                    request.headers["If-None-Match"] = etag
+                if last_modified:
+                    request.headers["If-Modified-Since"] = last_modified
+        response = super().send(request, stream=stream, **kwargs)
+        if stream:
+            return response
+        # 读取内容以统计实际传输的字节数（压缩后）
+        content = response.content
+        size = response.raw.tell() if hasattr(response.raw, "tell") else len(content or b"")
+        if response.status_code == 304 and cached:
+            _, _, content, encoding = cached
+            response.status_code = 200
+            response.reason = "OK"
+            response._content = content
+            response.encoding = encoding
+            self._stats.add(size, not_modified=True)
+            logger.debug(f"页面未变化，使用缓存内容：{request.url}")
+            return response
+        self._stats.add(size)
+        if (request.method == "GET" or keep) and response.status_code == 200:
+            self.__cache(key, response, keep=keep)
+        return response
+
+    def __cached_response(self, request, cached) -> requests.Response:
+        _, _, content, encoding = cached
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response._content = content
+        response._content_consumed = True
+        response.encoding = encoding
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def __cache(self, key: str, response: requests.Response, keep: bool = False):
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        with self._cache_lock:
+            if not (etag or last_modified or keep) or len(response.content or b"") > self._max_content:
+                self._cache.pop(key, None)
+                return
+            self._cache[key] = (etag, last_modified, response.content, response.encoding)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self._max_entries:
+                self._cache.popitem(last=False)
+
+
+class ConditionalHTTPAdapter(ConditionalAdapterMixin, HTTPAdapter):
+    """
+    条件请求适配器，经requests连接池发送
+    """
+
+
+class SiteSessionPool:
+    """
+    站点会话池，按站点复用requests会话（连接保持及cookie），cookie、UA或代理变化时重建，超出数量时淘汰最久未使用的会话
+    """
+
+    def __init__(self, max_size: int = 200, pool_maxsize: int = 4, fetcher: Any = None):
+        """
+        :param max_size: 最多保留的站点会话数
+        :param pool_maxsize: 每个会话的连接数
+        :param fetcher: 异步抓取引擎，设置时会话的请求经其共享连接池发送
+        """
+        self._max_size = max_size
+        self._pool_maxsize = pool_maxsize
+        self._fetcher = fetcher
+        self._sessions: "OrderedDict[str, Tuple[str, requests.Session]]" = OrderedDict()
+        self._lock = Lock()
+        # 所有会话共享的传输统计，异步模式下与抓取引擎共用
+        self.stats: TransferStats = fetcher.stats if fetcher else TransferStats()
+
+    @staticmethod
+    def __fingerprint(cookie: Optional[str], ua: Optional[str], proxy: Optional[bool]) -> str:
+        return hashlib.md5(f"{cookie}|{ua}|{proxy}".encode("utf-8")).hexdigest()
+
+    def __new_session(self) -> requests.Session:
+        session = requests.Session()
+        if self._fetcher:
+            adapter = self._fetcher.adapter()
+        else:
+            adapter = ConditionalHTTPAdapter(stats=self.stats, pool_connections=1, pool_maxsize=self._pool_maxsize)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def get(self, key: str, cookie: Optional[str], ua: Optional[str], proxy: Optional[bool]) -> requests.Session:
+        """
+        获取站点会话
+        """
+        fingerprint = self.__fingerprint(cookie, ua, proxy)
+        expired = []
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry and entry[0] == fingerprint:
+                self._sessions.move_to_end(key)
+                return entry[1]
+            if entry:
+                logger.debug(f"站点 {key} cookie或UA已变化，重建会话")
+                expired.append(entry[1])
+            session = self.__new_session()
+            self._sessions[key] = (fingerprint, session)
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self._max_size:
+                _, (_, old_session) = self._sessions.popitem(last=False)
+                expired.append(old_session)
+        for old_session in expired:
+            old_session.close()
+        return session
+
+    def evict(self, key: str):
+        """
+        移除站点会话
+        """
+        with self._lock:
+            entry = self._sessions.pop(key, None)
+        if entry:
+            entry[1].close()
+
+    @contextmanager
+    def session(self, key: str, cookie: Optional[str], ua: Optional[str], proxy: Optional[bool]):
+        """
+        使用站点会话，出现异常时移除该会话，避免复用已损坏的连接
+        """
+        try:
+            yield self.get(key, cookie=cookie, ua=ua, proxy=proxy)
+        except Exception:
+            self.evict(key)
+            raise
+
+    def clear(self):
+        """
+        关闭所有会话
+        """
+        with self._lock:
+            sessions = [session for _, session in self._sessions.values()]
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
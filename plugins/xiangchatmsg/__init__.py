@@ -1,12 +1,16 @@
-from typing import Any, List, Dict, Tuple
+from typing import Any, List, Dict, Tuple, Optional
 from urllib.parse import quote_plus
 
+import requests
+from requests.adapters import HTTPAdapter
+
 from app.core.event import eventmanager, Event
 from app.log import logger
 from app.plugins import _PluginBase
 from app.schemas.types import EventType, NotificationType
 from app.utils.http import RequestUtils
-import re
+
+from .renderer import MessageRenderer
 
 
 class XiangChatMsg(_PluginBase):
@@ -17,7 +21,7 @@ class XiangChatMsg(_PluginBase):
     # 插件图标
     plugin_icon = "Rocketchat_A.png"
     # 插件版本
-    plugin_version = "1.9"
+    plugin_version = "1.12"
     # 插件作者
     plugin_author = "Xiang"
     # 作者主页
@@ -28,8 +32,6 @@ class XiangChatMsg(_PluginBase):
     plugin_order = 30
     # 可使用的用户级别
     auth_level = 1
-    # 换行符替换正则
-    new_line_after_2space_pattern = re.compile(' *\n')
 
     # 私有属性
     _enabled = False
@@ -38,6 +40,18 @@ class XiangChatMsg(_PluginBase):
     _msgtypes = []
     # convert '\n' to "  \n"(add two spaces)
     _breaks = False 
+    # 连接池大小
+    _pool_size = 4
+    # 请求超时时间（秒）
+    _timeout = 10
+    # 长连接会话，服务器或连接池大小变化时重建
+    _session: Optional[requests.Session] = None
+    _session_key = None
+    # 消息模板
+    _title_template = None
+    _link_template = None
+    _text_template = None
+    _renderer: Optional[MessageRenderer] = None
 
     def init_plugin(self, config: dict = None):
         if config:
@@ -46,6 +60,40 @@ class XiangChatMsg(_PluginBase):
             self._server = config.get("server")
             self._apikey = config.get("apikey")
             self._breaks = config.get("breaks") or False
+            self._pool_size = int(config.get("pool_size") or 4)
+            self._timeout = int(config.get("timeout") or 10)
+            self._title_template = config.get("title_template")
+            self._link_template = config.get("link_template")
+            self._text_template = config.get("text_template")
+        self.__init_session()
+        # 预编译消息模板
+        self._renderer = MessageRenderer(
+            title=MessageRenderer.try_compile(self._title_template, "# {title}") + " \n",
+            link_title=MessageRenderer.try_compile(self._link_template, "[{title}]({link})") + " \n",
+            text=MessageRenderer.try_compile(self._text_template, "{text}") + " \n",
+            breaks=self._breaks)
+
+    def __init_session(self):
+        """
+        初始化长连接会话，配置未变化时沿用原会话
+        """
+        session_key = (self._server, self._pool_size) if self.get_state() else None
+        if session_key == self._session_key and (self._session or not session_key):
+            return
+        self.__close_session()
+        if session_key:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self._pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._session = session
+        self._session_key = session_key
+
+    def __close_session(self):
+        if self._session:
+            self._session.close()
+            self._session = None
+        self._session_key = None
 
     def get_state(self) -> bool:
         return self._enabled and (True if self._server and self._apikey else False)
@@ -171,6 +219,101 @@ class XiangChatMsg(_PluginBase):
                             }
                         ]
                     },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 6
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'pool_size',
+                                            'label': '连接池大小',
+                                            'placeholder': '4',
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 6
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'timeout',
+                                            'label': '超时时间（秒）',
+                                            'placeholder': '10',
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
+                    {
+                        'component': 'VRow',
+                        'content': [
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'title_template',
+                                            'label': '标题模板',
+                                            'placeholder': '# {title}',
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'link_template',
+                                            'label': '带链接的标题模板',
+                                            'placeholder': '[{title}]({link})',
+                                        }
+                                    }
+                                ]
+                            },
+                            {
+                                'component': 'VCol',
+                                'props': {
+                                    'cols': 12,
+                                    'md': 4
+                                },
+                                'content': [
+                                    {
+                                        'component': 'VTextField',
+                                        'props': {
+                                            'model': 'text_template',
+                                            'label': '正文模板',
+                                            'placeholder': '{text}',
+                                        }
+                                    }
+                                ]
+                            }
+                        ]
+                    },
                 ]
             }
         ], {
@@ -178,7 +321,12 @@ class XiangChatMsg(_PluginBase):
             'breaks': False,
             'msgtypes': [],
             'server': 'https://api.day.app',
-            'apikey': ''
+            'apikey': '',
+            'pool_size': 4,
+            'timeout': 10,
+            'title_template': '',
+            'link_template': '',
+            'text_template': ''
         }
 
     def get_page(self) -> List[dict]:
@@ -216,23 +364,16 @@ class XiangChatMsg(_PluginBase):
             if not self._server or not self._apikey:
                 return False, "参数未配置"
             rc_url = "%s/hooks/%s" % (self._server, self._apikey)
-            rc_text = None
-            if title:
-                if msg_body.get("url"):
-                    rc_text = "[%s](%s) \n" % (title, msg_body.get("url"))
-                else:
-                    rc_text = "# %s \n" % title
-            if text:
-                rc_text = "%s%s \n" % (rc_text, text)
-            if self._breaks:
-                trim_text = self.new_line_after_2space_pattern.sub('\n', rc_text)
-                rc_text = str.replace(trim_text, '\n', '  \n')
+            rc_text = self._renderer.render(title, text,
+                                            link=msg_body.get("url"),
+                                            msg_type=msg_type.value if msg_type else None)
             rc_data = {
                 "text": rc_text
             }
             logger.info(f"发送消息至{rc_url}, 内容：{rc_text}")
             res = RequestUtils(headers={
-                },content_type="application/json").post_res(rc_url, json=rc_data)
+                }, session=self._session, timeout=self._timeout,
+                content_type="application/json").post_res(rc_url, json=rc_data)
             if res and res.status_code == 200:
                 logger.info("发送成功")
             elif res is not None:
@@ -247,4 +388,4 @@ class XiangChatMsg(_PluginBase):
         """
         退出插件
         """
-        pass
+        self.__close_session()
@@ -0,0 +1,134 @@
+from string import Formatter
+from typing import List, Optional, Tuple
+
+from app.log import logger
+
+
+class MessageRenderer:
+    """
+    消息渲染：标题、带链接的标题、正文模板在初始化时预编译，渲染时一次拼接完成
+    开启硬换行时，模板中的固定文本在编译时转换，变量值在拼接时转换，不再对拼接结果整体替换
+    模板可用变量：{title} {link} {text} {type}，不支持格式说明及转换（如 {title:>10} {title!r}）
+    """
+
+    # 硬换行时行尾空格统一为两个空格
+    _break = '  \n'
+    _fields = ("title", "link", "text", "type")
+
+    def __init__(self, title: str = "# {title}  \n", link_title: str = "[{title}]({link})  \n",
+                 text: str = "{text} \n", breaks: bool = False):
+        self._breaks = breaks
+        self._title = self.__prepare(self.compile(title))
+        self._link_title = self.__prepare(self.compile(link_title))
+        self._text = self.__prepare(self.compile(text))
+
+    @classmethod
+    def compile(cls, template: str) -> List[Tuple[str, Optional[str]]]:
+        """
+        模板编译为(文本, 变量名)片段列表
+        """
+        parts = []
+        for literal, field, format_spec, conversion in Formatter().parse(template):
+            if field is not None and field not in cls._fields:
+                raise ValueError(f"模板变量 {{{field}}} 不存在，可用变量：{' '.join('{%s}' % f for f in cls._fields)}")
+            if format_spec or conversion:
+                raise ValueError(f"模板变量 {{{field}}} 不支持格式说明及转换")
+            parts.append((literal, field))
+        return parts
+
+    @classmethod
+    def try_compile(cls, template: Optional[str], default: str) -> str:
+        """
+        校验配置的模板，为空或无效时使用默认模板
+        """
+        if not template:
+            return default
+        try:
+            cls.compile(template)
+            return template
+        except ValueError as e:
+            logger.error(f"消息模板 {template} 无效：{str(e)}，使用默认模板")
+            return default
+
+    def __prepare(self, parts: List[Tuple[str, Optional[str]]]) -> Tuple[str, list]:
+        """
+        编译结果转换为渲染用的形式：(% 格式串, 硬换行转换后的(文本, 变量名)片段)
+        """
+        fmt = "".join(literal.replace("%", "%%") + ("%%(%s)s" % field if field else "") for literal, field in parts)
+        if self._breaks:
+            parts = [(self.__hard_break(literal), field) for literal, field in parts]
+        return fmt, parts
+
+    @classmethod
+    def __hard_break(cls, content: str) -> str:
+        """
+        每个换行前的空格统一为两个
+        """
+        if "\n" not in content:
+            return content
+        lines = content.split("\n")
+        last = lines.pop()
+        return cls._break.join([line.rstrip(" ") for line in lines]) + cls._break + last
+
+    @classmethod
+    def __append(cls, pieces: List[str], piece: str):
+        """
+        追加硬换行转换后的片段，片段以换行开头时去掉前面片段末尾的空格，与整体替换的结果一致
+        """
+        if not piece:
+            return
+        if piece.startswith(cls._break):
+            while pieces and pieces[-1].endswith(" "):
+                last = pieces.pop().rstrip(" ")
+                if last:
+                    pieces.append(last)
+                    break
+        pieces.append(piece)
+
+    def __fill(self, *segments: Tuple[Optional[tuple], Optional[dict]], breaks: bool = False) -> str:
+        """
+        拼接各段模板，segments为(预编译模板, 变量值)，模板为空的段跳过
+        """
+        if not breaks:
+            return "".join([template[0] % values for template, values in segments if template])
+        pieces = []
+        for template, values in segments:
+            if not template:
+                continue
+            for literal, field in template[1]:
+                self.__append(pieces, literal)
+                if field:
+                    self.__append(pieces, self.__hard_break(values[field]))
+        return "".join(pieces)
+
+    def __title_segment(self, title: Optional[str], link: Optional[str],
+                        msg_type: Optional[str]) -> Tuple[Optional[tuple], Optional[dict]]:
+        if not title:
+            return None, None
+        return self._link_title if link else self._title, {"title": title, "link": link or "", "text": "",
+                                                           "type": msg_type or ""}
+
+    def __text_segment(self, text: Optional[str], msg_type: Optional[str]) -> Tuple[Optional[tuple], Optional[dict]]:
+        if not text:
+            return None, None
+        return self._text, {"title": "", "link": "", "text": text, "type": msg_type or ""}
+
+    def render_title(self, title: Optional[str], link: Optional[str] = None, msg_type: Optional[str] = None) -> str:
+        """
+        渲染标题，不做硬换行
+        """
+        return self.__fill(self.__title_segment(title, link, msg_type))
+
+    def render_text(self, text: Optional[str], msg_type: Optional[str] = None) -> str:
+        """
+        渲染正文，开启硬换行时每个换行前保证两个空格
+        """
+        return self.__fill(self.__text_segment(text, msg_type), breaks=self._breaks)
+
+    def render(self, title: Optional[str], text: Optional[str], link: Optional[str] = None,
+               msg_type: Optional[str] = None) -> str:
+        """
+        渲染完整消息：标题+正文，开启硬换行时每个换行前保证两个空格
+        """
+        return self.__fill(self.__title_segment(title, link, msg_type), self.__text_segment(text, msg_type),
+                           breaks=self._breaks)
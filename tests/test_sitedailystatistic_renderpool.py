@@ -0,0 +1,122 @@
+import importlib.util
+import logging
+import sys
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+RENDERPOOL_PATH = Path(__file__).parent.parent / "plugins" / "sitedailystatistic" / "renderpool.py"
+
+
+@pytest.fixture(autouse=True)
+def app_log(monkeypatch):
+    """
+    脱离MoviePilot运行，以标准日志代替 app.log
+    """
+    if "app.log" not in sys.modules:
+        module = types.ModuleType("app.log")
+        module.logger = logging.getLogger("renderpool")
+        monkeypatch.setitem(sys.modules, "app", sys.modules.get("app") or types.ModuleType("app"))
+        monkeypatch.setitem(sys.modules, "app.log", module)
+
+
+@pytest.fixture
+def render_deps():
+    pytest.importorskip("playwright.sync_api")
+    pytest.importorskip("cf_clearance")
+
+
+def _load_render_pool():
+    spec = importlib.util.spec_from_file_location("sitedailystatistic_renderpool", RENDERPOOL_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.RenderPool
+
+
+class _FixtureHandler(BaseHTTPRequestHandler):
+    """
+    返回带cookie及UA回显的站点首页，/slow 延迟返回
+    """
+
+    def do_GET(self):
+        if self.path == "/slow":
+            time.sleep(3)
+        body = (f"<html><head><title>fixture</title></head><body>"
+                f"<div id='cookie'>{self.headers.get('Cookie', '')}</div>"
+                f"<div id='ua'>{self.headers.get('User-Agent', '')}</div>"
+                f"</body></html>").encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def fixture_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FixtureHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+@pytest.fixture
+def pool(render_deps):
+    render_pool = _load_render_pool()(size=2, timeout=10, headless=True)
+    yield render_pool
+    render_pool.stop()
+
+
+def test_render_with_cookie_and_ua(pool, fixture_url):
+    html = pool.get_page_source(url=f"{fixture_url}/", cookies="uid=1; pass=abc", ua="fixture-agent")
+    assert html and "fixture" in html
+    assert "uid=1; pass=abc" in html
+    assert "fixture-agent" in html
+
+
+def test_render_concurrent_sites(pool, fixture_url):
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(
+            lambda i: pool.get_page_source(url=f"{fixture_url}/?site={i}", cookies=f"uid={i}"), range(4)))
+    for i, html in enumerate(results):
+        assert html and f"uid={i}" in html
+
+
+def test_stop_does_not_wait_idle_timeout(pool, fixture_url):
+    assert pool.get_page_source(url=f"{fixture_url}/")
+    start = time.time()
+    pool.stop()
+    assert time.time() - start < 5
+
+
+def test_stop_fails_queued_pages(render_deps, fixture_url):
+    render_pool = _load_render_pool()(size=1, timeout=10, headless=True)
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [executor.submit(render_pool.get_page_source, url=f"{fixture_url}/slow") for _ in range(3)]
+        time.sleep(1)
+        start = time.time()
+        render_pool.stop()
+        results = [future.result(timeout=30) for future in futures]
+    # 正在渲染的页面可以完成，排队中的页面立即返回失败
+    assert results.count(None) >= 2
+    assert time.time() - start < 10
+
+
+def test_missing_dependencies(monkeypatch):
+    # 未安装playwright时模块仍可加载，渲染直接返回失败
+    monkeypatch.setitem(sys.modules, "playwright", None)
+    monkeypatch.setitem(sys.modules, "playwright.sync_api", None)
+    render_pool = _load_render_pool()(size=1, timeout=10)
+    start = time.time()
+    assert render_pool.get_page_source(url="http://127.0.0.1/") is None
+    assert time.time() - start < 5
+    render_pool.stop()